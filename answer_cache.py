@@ -0,0 +1,75 @@
+# LLM 답변 캐시 (프로세스 전체에서 공유)
+# (매칭된 행 번호, 답변 내용 해시, 정규화된 질문, 모델)을 키로 사용하며
+# LRU 방식으로 오래된 항목을 밀어내고, TTL이 지난 항목은 다시 생성합니다.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()[:16]
+
+
+class AnswerCache:
+    def __init__(self, max_entries=512, ttl_seconds=6 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (만료 시각, 답변 텍스트)
+        self._row_hashes = {} # 행 번호 -> 마지막으로 확인한 행 내용 해시
+        self._kb_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(row_id, answer, normalized_prompt, model):
+        return (row_id, content_hash(answer), normalized_prompt, model)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, text):
+        if not text:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_row(self, row_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == row_id]:
+                del self._entries[key]
+
+    def sync_rows(self, kb_version, row_hashes):
+        # 시트를 다시 읽었을 때 내용이 바뀌었거나 사라진 행의 캐시 항목을 지웁니다.
+        # 같은 버전이면 rerun마다 비교하지 않도록 바로 반환합니다.
+        if kb_version == self._kb_version:
+            return
+        changed_rows = [
+            row_id for row_id, row_hash in self._row_hashes.items()
+            if row_hashes.get(row_id) != row_hash
+        ]
+        for row_id in changed_rows:
+            self.invalidate_row(row_id)
+        self._row_hashes = dict(row_hashes)
+        self._kb_version = kb_version
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
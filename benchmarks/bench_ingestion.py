@@ -0,0 +1,87 @@
+# 시트 행 -> 매칭용 구조 변환(ingestion) 시간 비교
+# 변경 전 iterrows + 행마다 split(',') 루프와 knowledge_base.ingest_rows()의 열 단위(split/explode/strip) 처리를
+# 같은 가상 시트로 돌려 시간을 재고, 두 결과가 같은지도 확인합니다. (빈 머리글이 겹친 시트 포함)
+# 사용법: python benchmarks/bench_ingestion.py --rows 1000 10000 100000
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from answer_cache import content_hash  # noqa: E402
+from knowledge_base import KB_COLUMNS, ingest_rows, split_aliases  # noqa: E402
+from synthetic_kb import ALIASES_PER_ROW, make_sheet_values  # noqa: E402
+
+
+# 변경 전 build_knowledge_base의 iterrows 루프와 동일한 구현
+def legacy_ingest_rows(combined_df):
+    questions = []
+    alias_rows = []
+    row_answers = []
+    row_image_urls = []
+    row_hashes = {}
+    for index, row in combined_df.iterrows():
+        question_cell = row.get('질문', '')
+        answer_cell = row.get('답변', '')
+        image_url_cell = row.get('Image URL', '')
+        row_answers.append(answer_cell)
+        row_image_urls.append(image_url_cell)
+        row_hashes[index] = content_hash(answer_cell, image_url_cell)
+        for q in split_aliases(question_cell):
+            questions.append(q)
+            alias_rows.append(index)
+    return questions, alias_rows, row_answers, row_image_urls, row_hashes
+
+
+def best_of(fn, arg, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(arg)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def same_result(legacy, vectorized):
+    return (
+        legacy[0] == vectorized[0]
+        and legacy[1] == vectorized[1].tolist()
+        and legacy[2:] == vectorized[2:]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'aliases':>8} {'iterrows ms':>12} {'vectorized ms':>14} {'speedup':>8}")
+    for n_rows in args.rows:
+        values = make_sheet_values(n_rows * ALIASES_PER_ROW)["Sheet1"]
+        combined_df = pd.DataFrame(values[1:], columns=values[0])[KB_COLUMNS]
+
+        legacy_seconds, legacy = best_of(legacy_ingest_rows, combined_df, args.repeat)
+        vectorized_seconds, vectorized = best_of(ingest_rows, combined_df, args.repeat)
+
+        if not same_result(legacy, vectorized):
+            print(f"결과가 다릅니다: rows={n_rows}")
+            return 1
+        # Data_Input 탭이 없으면 Sheet1의 모든 컬럼이 그대로 들어오므로, 빈 머리글이 겹친 시트도 같은 결과인지 확인합니다.
+        padded_df = pd.DataFrame([row + ['메모', ''] for row in values[1:]], columns=values[0] + ['', ''])
+        if not same_result(legacy_ingest_rows(padded_df), ingest_rows(padded_df)):
+            print(f"머리글이 겹친 시트의 결과가 다릅니다: rows={n_rows}")
+            return 1
+        print(f"{n_rows:>8} {len(vectorized[0]):>8} {legacy_seconds * 1000:>12.1f} "
+              f"{vectorized_seconds * 1000:>14.1f} {legacy_seconds / vectorized_seconds:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
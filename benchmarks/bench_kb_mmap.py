@@ -0,0 +1,95 @@
+# 프로세스별 지식 베이스 준비 시간/메모리 비교: 직접 만들기 vs 공유 kb_mmap 파일 열기
+# 가상 시트로 kb_mmap 파일을 한 번 만든 뒤, 워커 프로세스 여러 개를 띄워
+#   build: 프로세스마다 시트 값(JSON)에서 build_knowledge_base()로 지식 베이스를 만듦 (기존 방식)
+#   mmap:  프로세스마다 같은 파일을 open_kb_file()로 엶
+# 으로 준비 시간과 질의 처리 후 메모리(/proc/self/smaps_rollup의 Rss, Pss, Anonymous)를 잽니다.
+# 메모리는 import 직후 값을 뺀 증가분입니다. (Linux 전용)
+# 사용법: python benchmarks/bench_kb_mmap.py --sizes 10000 100000 --workers 4
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from kb_mmap import open_kb_file, write_kb_file  # noqa: E402
+from knowledge_base import build_knowledge_base  # noqa: E402
+from match_index import find_best_match  # noqa: E402
+from synthetic_kb import make_queries, make_sheet_values  # noqa: E402
+
+
+def memory_kb():
+    # smaps_rollup의 (Rss, Pss, Anonymous) - 단위 kB. Anonymous는 파일과 무관한 프로세스 고유 메모리(힙 등)
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Rss"], fields["Pss"], fields["Anonymous"]
+
+
+def worker(mode, fixture_path, kb_path, queries, results):
+    before = memory_kb()
+    started = time.perf_counter()
+    if mode == "build":
+        with open(fixture_path, encoding="utf-8") as f:
+            kb = build_knowledge_base(json.load(f))
+    else:
+        kb, _ = open_kb_file(kb_path)
+    ready = time.perf_counter() - started
+    for query in queries:
+        best_match, _, idx = find_best_match(query, kb['match_index'])
+        if best_match is not None:
+            kb['row_answers'][int(kb['alias_rows'][idx])]
+    after = memory_kb()
+    results.put((ready, *[a - b for a, b in zip(after, before)]))
+
+
+def run_workers(mode, fixture_path, kb_path, queries, n_workers):
+    # 모든 워커가 끝날 때까지 살아 있어야 공유 페이지가 Pss에 나뉘어 잡히므로 결과를 받은 뒤에 join합니다.
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(mode, fixture_path, kb_path, queries, results))
+                 for _ in range(n_workers)]
+    for p in processes:
+        p.start()
+    rows = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'aliases':>8} {'mode':>6} {'file MB':>8} {'ready ms':>9} {'rss MB':>7} {'pss MB':>7} {'anon MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_aliases in args.sizes:
+            sheet_values = make_sheet_values(n_aliases)
+            queries = [query for query, _, _ in make_queries(sheet_values, args.queries, hard_share=0.3)]
+            fixture_path = os.path.join(tmp, f"fixture_{n_aliases}.json")
+            kb_path = os.path.join(tmp, f"kb_{n_aliases}.bin")
+            with open(fixture_path, "w", encoding="utf-8") as f:
+                json.dump(sheet_values, f, ensure_ascii=False)
+            write_kb_file(kb_path, build_knowledge_base(sheet_values))
+            file_mb = os.path.getsize(kb_path) / 1e6
+
+            for mode in ("build", "mmap"):
+                rows = run_workers(mode, fixture_path, kb_path, queries, args.workers)
+                ready = sorted(r[0] for r in rows)[len(rows) // 2]
+                rss, pss, anon = (sum(r[i] for r in rows) / len(rows) / 1024 for i in (1, 2, 3))
+                print(f"{n_aliases:>8} {mode:>6} {file_mb:>8.1f} {ready * 1000:>9.1f} {rss:>7.1f} {pss:>7.1f} {anon:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# 기존 find_best_match(extractOne) 경로와 MatchIndex 경로의 턴당 매칭 시간을 비교합니다.
+# --variants를 주면 동의어 확장 질의 N개를 질의마다 루프로 매칭하는 방식과
+# find_best_match_many의 한 번의 cdist 행렬 계산 방식도 함께 비교합니다.
+# 사용법: python benchmarks/bench_match_index.py --aliases 1000 5000 --queries 200 --variants 20
+import argparse
+import os
+import random
+import sys
+import time
+
+from rapidfuzz import process, fuzz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from match_index import MatchIndex, find_best_match, find_best_match_many  # noqa: E402
+
+ROOMS = [f"{n}번방" for n in range(1, 41)]
+SURGERIES = ["TUC", "TURP", "라파 담낭절제술", "갑상선 절제술", "인공관절 치환술", "제왕절개", "복강경 충수절제술"]
+TOPICS = ["수술 세팅 방법", "필요한 장비", "사용하는 기구", "준비 물품", "수술 준비", "체위 고정 방법"]
+
+
+def make_questions(n_aliases, seed=0):
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(ROOMS)} {rng.choice(SURGERIES)} {rng.choice(TOPICS)} {i}"
+        for i in range(n_aliases)
+    ]
+
+
+# 변경 전 newchatbot.py의 find_best_match와 동일한 구현
+def legacy_find_best_match(user_input, questions, threshold=65):
+    if not questions:
+        return None, 0, -1
+    result = process.extractOne(user_input, questions, scorer=fuzz.ratio)
+    if result and result[1] >= threshold:
+        return result[0], result[1], result[2]
+    return None, result[1] if result else 0, result[2] if result else -1
+
+
+def time_per_query(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--aliases", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--variants", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'aliases':>8} {'build ms':>9} {'legacy ms/q':>12} {'index ms/q':>11} {'speedup':>8}")
+    for n in args.aliases:
+        questions = make_questions(n)
+        rng = random.Random(1)
+        queries = [rng.choice(questions).rsplit(" ", 1)[0].upper() for _ in range(args.queries)]
+
+        start = time.perf_counter()
+        index = MatchIndex(questions)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        legacy_ms = time_per_query(lambda q: legacy_find_best_match(q, questions), queries)
+        index_ms = time_per_query(lambda q: find_best_match(q, index), queries)
+        print(f"{n:>8} {build_ms:>9.1f} {legacy_ms:>12.3f} {index_ms:>11.3f} {legacy_ms / index_ms:>7.1f}x")
+
+        if args.variants:
+            variant_sets = [
+                [f"{q} {rng.choice(TOPICS)}" for _ in range(args.variants)] for q in queries
+            ]
+            loop_ms = time_per_query(
+                lambda vs: max((find_best_match(v, index) for v in vs), key=lambda r: r[1]), variant_sets
+            )
+            batch_ms = time_per_query(lambda vs: find_best_match_many(vs, index, workers=-1), variant_sets)
+            print(f"{'':>8} {args.variants} variants: loop {loop_ms:.3f} ms/q, batch {batch_ms:.3f} ms/q")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# 오프라인 검색(매칭) 벤치마크
+# 가상 지식 베이스(100 ~ 100k 별칭)를 knowledge_base.build_knowledge_base()로 만들고, 질의 세트를
+# 동의어 정규화 + find_best_match 경로로 재생해 처리량, 지연 시간 백분위, 최대 메모리, 정확도를 측정합니다.
+# 구글 시트/Perplexity 없이 실행되며, 커밋별로 비교할 수 있도록 JSON 리포트를 남깁니다.
+#
+# 사용법:
+#   python benchmarks/bench_retrieval.py                       # 100, 1k, 10k, 100k
+#   python benchmarks/bench_retrieval.py --sizes 1000 10000 --queries 500
+#   python benchmarks/bench_retrieval.py --compare benchmarks/results/<이전 커밋>.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from knowledge_base import build_knowledge_base  # noqa: E402
+from match_index import MatchIndex, find_best_match  # noqa: E402
+from semantic_index import HybridMatchIndex  # noqa: E402
+from synthetic_kb import make_queries, make_sheet_values  # noqa: E402
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+ENGINES = {"hybrid": HybridMatchIndex, "ratio": MatchIndex}
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_query(kb, query):
+    # (매칭된 행 번호, 매칭된 질문) - 매칭 실패면 (None, None)
+    best_match, score, idx = find_best_match(query, kb['match_index'])
+    if best_match is None:
+        return None, None
+    return int(kb['alias_rows'][idx]), best_match
+
+
+def bench_size(n_aliases, n_queries, warmup=20, engine="hybrid", hard_share=0.0):
+    sheet_values = make_sheet_values(n_aliases)
+    queries = make_queries(sheet_values, n_queries, hard_share=hard_share)
+    index_class = ENGINES[engine]
+
+    # 메모리는 tracemalloc으로 따로 측정합니다. (tracemalloc이 켜져 있으면 시간이 부풀려지므로)
+    tracemalloc.start()
+    kb = build_knowledge_base(sheet_values, index_class=index_class)
+    for query, _, _ in queries[:50]:
+        run_query(kb, query)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    kb = build_knowledge_base(sheet_values, index_class=index_class)
+    build_seconds = time.perf_counter() - started
+
+    for query, _, _ in queries[:warmup]:
+        run_query(kb, query)
+
+    latencies = []
+    correct = 0
+    started = time.perf_counter()
+    for query, expected_row, alias in queries:
+        t0 = time.perf_counter()
+        row, matched_question = run_query(kb, query)
+        latencies.append(time.perf_counter() - t0)
+        # 같은 별칭이 여러 행에 있을 수 있으므로 같은 별칭을 찾았으면 정답으로 봅니다.
+        correct += row == expected_row or (alias is not None and matched_question == alias)
+    wall_seconds = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "aliases": len(kb['questions']),
+        "queries": len(queries),
+        "build_ms": build_seconds * 1000,
+        "throughput_qps": len(queries) / wall_seconds,
+        "latency_ms": {"p50": p50, "p95": p95, "p99": p99, "max": max(latencies) * 1000},
+        "peak_memory_mb": peak_bytes / (1024 * 1024),
+        "accuracy": correct / len(queries),
+    }
+
+
+def print_table(results, baseline=None):
+    baseline_by_size = {r["aliases"]: r for r in (baseline or {}).get("results", [])}
+    print(f"{'aliases':>8} {'build ms':>9} {'q/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8} {'acc':>6}")
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{r['aliases']:>8} {r['build_ms']:>9.1f} {r['throughput_qps']:>9.1f} {lat['p50']:>8.3f} "
+              f"{lat['p95']:>8.3f} {lat['p99']:>8.3f} {r['peak_memory_mb']:>8.1f} {r['accuracy']:>6.3f}")
+        base = baseline_by_size.get(r["aliases"])
+        if base:
+            print(f"{'':>8} vs {baseline['revision']}: p95 {lat['p95'] / base['latency_ms']['p95']:.2f}x, "
+                  f"q/s {r['throughput_qps'] / base['throughput_qps']:.2f}x, "
+                  f"peak {r['peak_memory_mb'] / base['peak_memory_mb']:.2f}x, "
+                  f"acc {r['accuracy'] - base['accuracy']:+.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="hybrid", help="매칭 인덱스 (hybrid: n-gram + 재정렬, ratio: 전체 fuzz.ratio)")
+    parser.add_argument("--hard-queries", type=float, default=0.0, help="어순 변경/일부 단어 질의 비율 (0~1)")
+    parser.add_argument("--output", help="리포트 경로 (기본: benchmarks/results/<커밋>.json)")
+    parser.add_argument("--compare", help="비교할 이전 리포트(JSON)")
+    args = parser.parse_args()
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "engine": args.engine,
+        "hard_queries": args.hard_queries,
+        "results": [bench_size(n, args.queries, engine=args.engine, hard_share=args.hard_queries) for n in args.sizes],
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(report["results"], baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['revision']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"리포트 저장: {output}")
+
+
+if __name__ == "__main__":
+    main()
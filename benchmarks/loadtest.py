@@ -0,0 +1,277 @@
+# 동시 세션 부하 테스트
+# 로컬 OpenAI 호환 스텁(stub_llm_server.py)과 가상 시트 픽스처(synthetic_kb.py)로 newchatbot.py를 띄우고,
+# N개의 세션이 동시에 질문을 보내는 상황을 Streamlit AppTest로 재생합니다.
+# 모든 세션은 한 프로세스에서 실행되므로 cache_resource 자원(지식 베이스, 답변 캐시, 지표 기록기)을
+# 실제 서버처럼 공유합니다. 구글 시트/Perplexity 없이 실행됩니다.
+#
+# 측정 항목:
+#   - 턴별 종단 지연 시간(질문 입력 ~ 스크립트 실행 완료) p50/p95/max
+#   - 첫 토큰 시간(ttft)과 스텁이 설정한 ttft보다 늦어진 시간
+#   - 세션별 정체 시간(stall): 스텁 지연을 뺀 첫 토큰 대기 + 토큰 간격보다 길었던 청크 공백
+#   - 프로세스 CPU 사용 시간/사용률, 최대 메모리(RSS)
+#
+# 사용법:
+#   python benchmarks/loadtest.py --sessions 8 --turns 5
+#   python benchmarks/loadtest.py --sessions 32 --ttft 1.0 --tokens-per-sec 20 --report load.json
+#   python benchmarks/loadtest.py --ttft 5 --first-token-slo 1 --hedge-model sonar   # 느린 모델 + 빠른 모델 hedge
+#   python benchmarks/loadtest.py --base-url http://127.0.0.1:8765   # 이미 떠 있는 스텁 사용
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "newchatbot.py")
+sys.path.insert(0, BENCH_DIR)
+from stub_llm_server import start_stub_server  # noqa: E402
+from synthetic_kb import make_queries, make_sheet_values  # noqa: E402
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+        "count": int(len(values)),
+    }
+
+
+def write_fixture(directory, n_aliases):
+    sheet_values = make_sheet_values(n_aliases)
+    for row in sheet_values["Sheet1"][1:]:
+        row[2] = "" # 가상 이미지 파일은 없으므로 이미지 없이 답변
+    path = os.path.join(directory, "fixture.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(sheet_values, f, ensure_ascii=False)
+    return sheet_values, path
+
+
+def make_session_prompts(sheet_values, sessions, turns, cache_hits):
+    # 매칭되는 질의만 사용합니다.
+    # cache_hits면 모든 세션이 같은 순서로 같은 질문을 보내고, 아니면 뒤에 번호를 붙여 세션/턴마다 다른 질문이 되게 합니다.
+    queries = [q for q, row_id, _ in make_queries(sheet_values, sessions * turns * 2) if row_id is not None]
+    prompts = []
+    for session_no in range(sessions):
+        if cache_hits:
+            prompts.append([queries[turn_no % len(queries)] for turn_no in range(turns)])
+        else:
+            prompts.append([
+                f"{queries[(session_no * turns + turn_no) % len(queries)]} {session_no}-{turn_no}"
+                for turn_no in range(turns)
+            ])
+    return prompts
+
+
+def install_shared_runtime(base_url, extra_secrets=None):
+    # AppTest는 실행할 때마다 전역 st.secrets와 Runtime 인스턴스를 바꿔 끼우고 끝나면 지우므로,
+    # 여러 세션을 동시에 실행하면 서로의 런타임을 지워 버립니다.
+    # 부하 테스트에서는 모든 세션이 하나의 (가짜) 런타임과 secrets를 공유하도록 한 번만 설정합니다.
+    from unittest.mock import MagicMock
+
+    import streamlit as st
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import app_test
+
+    secrets = Secrets()
+    secrets._secrets = {"PERPLEXITY_API_KEY": "loadtest", "PERPLEXITY_BASE_URL": base_url, **(extra_secrets or {})}
+    st.secrets = secrets
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+    class _SharedRuntime: # AppTest.run()의 Runtime._instance 대입/해제를 받아 버리는 자리
+        _instance = None
+
+    app_test.Runtime = _SharedRuntime
+
+    # AppTest는 실행마다 새 ScriptCache로 스크립트를 다시 컴파일하는데, 파이썬 3.11의 ast.parse는
+    # 여러 스레드에서 동시에 부르면 SystemError가 납니다. 실제 서버처럼 컴파일 결과를 프로세스에서 공유합니다.
+    bytecode = {}
+    compile_lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def get_shared_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in bytecode:
+                bytecode[script_path] = get_bytecode(self, script_path)
+            return bytecode[script_path]
+
+    ScriptCache.get_bytecode = get_shared_bytecode
+
+
+def new_session(user_id, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state["login"] = True
+    at.session_state["user_id"] = user_id
+    return at.run()
+
+
+def run_session(session_no, prompts, stub_ttft, token_interval, timeout, start_barrier, results):
+    turns = []
+    errors = []
+    try:
+        at = new_session(f"load{session_no}", timeout)
+        start_barrier.wait()
+        for prompt in prompts:
+            started = time.perf_counter()
+            at.chat_input[0].set_value(prompt).run()
+            elapsed = time.perf_counter() - started
+            if at.exception:
+                errors.append(at.exception[0].value)
+                continue
+            turn_metrics = at.session_state["last_turn_metrics"]
+            stream_stats = at.session_state["last_stream_stats"] if "last_stream_stats" in at.session_state else None
+            if turn_metrics.get("cache_hit") or stream_stats is None:
+                stream_stats = None
+            else:
+                at.session_state["last_stream_stats"] = None # 다음 턴이 캐시 적중일 때 이전 값을 읽지 않도록
+            turn = {"e2e": elapsed, "matched": turn_metrics.get("matched_row") is not None,
+                    "cache_hit": bool(turn_metrics.get("cache_hit")), "coalesced": bool(turn_metrics.get("coalesced")),
+                    "llm_path": turn_metrics.get("llm_path"), "ttft": None, "stall": 0.0}
+            if stream_stats is not None and stream_stats["ttft"] is not None:
+                turn["ttft"] = stream_stats["ttft"]
+                turn["stall"] = (max(0.0, stream_stats["ttft"] - stub_ttft)
+                                 + max(0.0, stream_stats.get("max_gap", 0.0) - token_interval))
+            turns.append(turn)
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    results[session_no] = {"turns": turns, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--aliases", type=int, default=1000, help="가상 시트의 별칭(질문) 수")
+    parser.add_argument("--ttft", type=float, default=0.5, help="스텁의 첫 토큰 지연(초)")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--base-url", help="이미 실행 중인 OpenAI 호환 서버 주소 (지정하지 않으면 스텁을 띄움)")
+    parser.add_argument("--cache-hits", action="store_true", help="세션끼리 같은 질문을 보내 답변 캐시 적중을 허용")
+    parser.add_argument("--first-token-slo", type=float, help="앱의 FIRST_TOKEN_SLO(초) - 0이면 끔")
+    parser.add_argument("--hedge-model", help="앱의 HEDGE_MODEL (목표를 넘기면 함께 보낼 빠른 모델)")
+    parser.add_argument("--hedge-ttft", type=float, default=0.2, help="스텁에서 --hedge-model의 첫 토큰 지연(초)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="턴 하나의 스크립트 실행 제한 시간(초)")
+    parser.add_argument("--report", help="결과를 JSON으로 저장할 경로")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ori-loadtest-")
+    sheet_values, fixture_path = write_fixture(work_dir, args.aliases)
+    os.environ["ORI_SHEET_FIXTURE"] = fixture_path
+    os.environ["ORI_DATA_DIR"] = os.path.join(work_dir, "data") # 실제 스냅샷/채팅 기록을 건드리지 않음
+    os.chdir(REPO_DIR) # 앱이 images/, ori_icon.png를 상대 경로로 읽음
+
+    base_url = args.base_url
+    stub_server = None
+    if base_url is None:
+        model_ttft = {args.hedge_model: args.hedge_ttft} if args.hedge_model else None
+        stub_server, base_url = start_stub_server(ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, model_ttft=model_ttft)
+    token_interval = 1.0 / args.tokens_per_sec
+    extra_secrets = {}
+    if args.first_token_slo is not None:
+        extra_secrets["FIRST_TOKEN_SLO"] = args.first_token_slo
+    if args.hedge_model:
+        extra_secrets["HEDGE_MODEL"] = args.hedge_model
+    install_shared_runtime(base_url, extra_secrets)
+    # 세션 스레드가 스크립트 밖에서 session_state를 읽을 때 나오는 ScriptRunContext 경고는 숨깁니다.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda record: "missing ScriptRunContext" not in record.getMessage()
+    )
+
+    # 첫 실행(모듈 로딩, 지식 베이스/인덱스 생성)은 따로 잽니다.
+    started = time.perf_counter()
+    new_session("warmup", args.timeout)
+    cold_start = time.perf_counter() - started
+
+    prompts = make_session_prompts(sheet_values, args.sessions, args.turns, args.cache_hits)
+    results = [None] * args.sessions
+    start_barrier = threading.Barrier(args.sessions)
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(i, prompts[i], args.ttft, token_interval, args.timeout, start_barrier, results),
+            name=f"session-{i}",
+        )
+        for i in range(args.sessions)
+    ]
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    requests_before = stub_server.RequestHandlerClass.requests if stub_server is not None else None
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    turns = [turn for result in results for turn in result["turns"]]
+    errors = [error for result in results for error in result["errors"]]
+    session_stalls = [sum(turn["stall"] for turn in result["turns"]) for result in results]
+    report = {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "aliases": args.aliases,
+        "stub": None if args.base_url else {"ttft": args.ttft, "tokens_per_sec": args.tokens_per_sec},
+        "cold_start_seconds": cold_start,
+        "wall_seconds": wall,
+        "turns_completed": len(turns),
+        "turns_per_second": len(turns) / wall if wall else None,
+        "cache_hits": sum(turn["cache_hit"] for turn in turns),
+        "coalesced": sum(turn["coalesced"] for turn in turns), # 진행 중인 같은 요청에 합쳐진 턴
+        # 캐시를 놓친 턴의 답변 경로 (primary, primary_late, hedge, sheet)
+        "llm_paths": dict(Counter(turn["llm_path"] for turn in turns if turn["llm_path"])),
+        "llm_requests": (stub_server.RequestHandlerClass.requests - requests_before) if stub_server is not None else None,
+        "errors": errors,
+        "e2e": percentiles([turn["e2e"] for turn in turns]),
+        "ttft": percentiles([turn["ttft"] for turn in turns if turn["ttft"] is not None]),
+        "session_stall": percentiles(session_stalls),
+        "cpu_seconds": cpu,
+        "cpu_utilization": cpu / wall if wall else None, # 1.0 = 코어 하나를 꽉 채움
+        "max_rss_mb": usage_after.ru_maxrss / 1024, # 리눅스 기준 KB 단위
+    }
+
+    print(f"{args.sessions} sessions x {args.turns} turns, {args.aliases} aliases, base_url={base_url}")
+    print(f"cold start {cold_start:.2f}s, wall {wall:.2f}s, {report['turns_per_second']:.2f} turns/s, "
+          f"cache hits {report['cache_hits']}/{len(turns)}, coalesced {report['coalesced']}, "
+          f"LLM requests {report['llm_requests'] if report['llm_requests'] is not None else '-'}, errors {len(errors)}")
+    if report["llm_paths"]:
+        print("llm paths: " + ", ".join(f"{path} {count}" for path, count in sorted(report["llm_paths"].items())))
+    for name in ("e2e", "ttft", "session_stall"):
+        stats = report[name]
+        if stats:
+            print(f"{name:>14}: p50 {stats['p50'] * 1000:8.1f} ms  p95 {stats['p95'] * 1000:8.1f} ms  "
+                  f"max {stats['max'] * 1000:8.1f} ms  (n={stats['count']})")
+    print(f"cpu {cpu:.2f}s ({report['cpu_utilization']:.0%} of one core), max RSS {report['max_rss_mb']:.0f} MB")
+    for error in errors[:5]:
+        print("error:", error)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# 로컬 OpenAI 호환 스텁 서버 (부하 테스트/개발용)
+# POST /chat/completions (또는 /v1/chat/completions)에 대해 미리 정한 답변을
+# 설정한 첫 토큰 지연(ttft)과 초당 토큰 수(tokens_per_sec)로 SSE 스트리밍합니다.
+#
+# 사용법: python benchmarks/stub_llm_server.py --port 8765 --ttft 0.5 --tokens-per-sec 40
+#         python benchmarks/stub_llm_server.py --ttft 8 --model-ttft sonar=0.3   # 모델별 첫 토큰 지연 (느린 기본 모델 + 빠른 모델)
+# 앱에서는 .streamlit/secrets.toml에 PERPLEXITY_BASE_URL = "http://127.0.0.1:8765" 를 지정합니다.
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANSWER = (
+    "✅ **수술 준비 요약**\n\n"
+    "1. 🛏️ 쇄석위 고정 장치 준비\n"
+    "2. 📺 방광경 카메라와 모니터 연결\n"
+    "3. 🔌 전기소작기 설정 확인\n"
+    "4. 🧰 Resectoscope Set, Foley Catheter 준비\n\n"
+    "| 구분 | 물품 |\n|---|---|\n| 장비 | C-arm, 전기소작기 |\n| 도구 | Resectoscope Set |\n"
+)
+
+
+def tokenize(text):
+    # 공백 단위로 나눠 공백을 토큰 뒤에 붙입니다. (합치면 원문과 같음)
+    tokens = []
+    for word in text.split(" "):
+        tokens.append(word + " ")
+    tokens[-1] = tokens[-1][:-1]
+    return tokens
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    ttft = 0.5
+    tokens_per_sec = 40.0
+    answer = CANNED_ANSWER
+    model_ttft = {} # 모델 이름 -> 첫 토큰 지연 (없으면 ttft)
+    requests = 0 # 받은 chat/completions 요청 수
+    _count_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass # keep-alive 연결을 클라이언트가 닫은 경우
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        with self._count_lock:
+            type(self).requests += 1
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "stub")
+        ttft = self.model_ttft.get(model, self.ttft)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 2
+        tokens = tokenize(self.answer)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        created = int(time.time())
+
+        if not request.get("stream"):
+            time.sleep(ttft + len(tokens) / self.tokens_per_sec)
+            self._send_json(200, {
+                "id": "stub", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None, with_usage=False):
+            payload = {
+                "id": "stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if with_usage:
+                payload["usage"] = usage
+            return json.dumps(payload, ensure_ascii=False)
+
+        try:
+            time.sleep(ttft)
+            send_event(chunk({"role": "assistant", "content": ""}))
+            interval = 1.0 / self.tokens_per_sec
+            for token in tokens:
+                send_event(chunk({"content": token}))
+                time.sleep(interval)
+            send_event(chunk({}, finish_reason="stop", with_usage=True))
+            send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass # 클라이언트가 스트림을 취소한 경우
+
+
+def start_stub_server(port=0, ttft=0.5, tokens_per_sec=40.0, answer=CANNED_ANSWER, model_ttft=None):
+    # 백그라운드 스레드에서 서버를 띄우고 (server, base_url)을 반환합니다. port=0이면 빈 포트 사용.
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "ttft": ttft, "tokens_per_sec": tokens_per_sec, "answer": answer, "model_ttft": dict(model_ttft or {}),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.5, help="첫 토큰까지 지연(초)")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--model-ttft", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="특정 모델의 첫 토큰 지연 (여러 번 지정 가능)")
+    args = parser.parse_args()
+    model_ttft = {model: float(seconds) for model, seconds in (item.split("=", 1) for item in args.model_ttft)}
+    server, base_url = start_stub_server(args.port, args.ttft, args.tokens_per_sec, model_ttft=model_ttft)
+    print(f"stub LLM server: {base_url} (ttft={args.ttft}s, {args.tokens_per_sec} tok/s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# 벤치마크용 가상 수술 Q/A 시트 생성기
+# load_google_sheet_data()가 읽는 것과 같은 형태(탭별 get_all_values() 결과)를 만들어
+# knowledge_base.build_knowledge_base()에 그대로 넣을 수 있게 합니다.
+import random
+
+ROOMS = [f"{n}번방" for n in range(1, 61)]
+SURGERIES = [
+    "TUC", "TURP", "TURBT", "라파 담낭절제술", "갑상선 절제술", "인공관절 치환술", "제왕절개",
+    "복강경 충수절제술", "유방 부분절제술", "척추 유합술", "백내장 수술", "편도 절제술",
+    "신장 절제술", "전립선 절제술", "위 절제술", "대장 절제술", "탈장 교정술", "치핵 절제술",
+]
+TOPICS = [
+    "수술 세팅 방법", "필요한 장비", "사용하는 기구", "준비 물품", "수술 준비", "체위 고정 방법",
+    "소독 범위", "드레이핑 순서", "카운트 절차", "전기소작기 설정",
+]
+DOCTORS = ["김", "이", "박", "최", "정", "강", "조", "윤"]
+INSTRUMENTS = [
+    "망원경", "방광경 카메라", "쇄석위 고정 장치", "C-arm", "전기소작기", "Resectoscope Set",
+    "Foley Catheter", "석션", "모니터", "지혈대", "봉합사 3-0", "Kelly", "Metzenbaum",
+]
+HEADER = ["질문", "답변", "Image URL"]
+ALIASES_PER_ROW = 4
+
+
+def make_answer(rng, room, surgery):
+    items = rng.sample(INSTRUMENTS, k=6)
+    lines = [f"{room} {surgery} 준비 사항입니다."]
+    lines += [f"- {item}" for item in items]
+    lines.append(f"집도의: {rng.choice(DOCTORS)} 교수님 선호 세팅")
+    return "\n".join(lines)
+
+
+def make_sheet_values(n_aliases, seed=0):
+    # 별칭(질문) 수가 n_aliases가 되도록 행을 만듭니다. 행마다 ALIASES_PER_ROW개의 별칭을 가집니다.
+    rng = random.Random(seed)
+    rows = [HEADER]
+    n_rows = max(1, n_aliases // ALIASES_PER_ROW)
+    for row_no in range(n_rows):
+        room = rng.choice(ROOMS)
+        surgery = rng.choice(SURGERIES)
+        doctor = rng.choice(DOCTORS)
+        topics = rng.sample(TOPICS, k=ALIASES_PER_ROW)
+        # 실제 시트의 '37번방 TUC 세팅'처럼 방/집도의/수술/주제를 조합합니다. (큰 시트에서는 겹치는 별칭도 생김)
+        aliases = [f"{room} {doctor}교수 {surgery} {topic}" for topic in topics]
+        image = f"{room}_{row_no}.png" if rng.random() < 0.3 else ""
+        rows.append([", ".join(aliases), make_answer(rng, room, surgery), image])
+    return {"Sheet1": rows, "Data_Input": [HEADER + ["입력 시간"]], "Synonyms": None}
+
+
+def _typo(rng, text):
+    if len(text) < 4:
+        return text
+    i = rng.randrange(len(text))
+    return text[:i] + text[i + 1:]
+
+
+def _reorder(rng, text):
+    words = text.split(" ")
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def _partial(rng, text):
+    # 방 번호와 수술명처럼 일부 단어만 남깁니다.
+    words = text.split(" ")
+    keep = sorted(rng.sample(range(len(words)), k=max(2, len(words) - 2)))
+    return " ".join(words[i] for i in keep)
+
+
+def make_queries(sheet_values, n_queries, seed=1, hard_share=0.0):
+    # (질의, 기대하는 행 번호, 원래 별칭) 목록. 행 번호가 None이면 매칭되지 않아야 하는 질의입니다.
+    # hard_share: 어순을 바꾸거나 일부 단어만 남긴 질의의 비율 (기본 0 - 이전 리포트와 같은 질의 세트)
+    rng = random.Random(seed)
+    hard_rng = random.Random(seed + 1)
+    rows = sheet_values["Sheet1"][1:]
+    queries = []
+    for _ in range(n_queries):
+        kind = rng.random()
+        if kind < 0.1:
+            queries.append((f"{rng.choice(['오늘', '내일'])} 점심 메뉴 {rng.randrange(100)}", None, None))
+            continue
+        row_id = rng.randrange(len(rows))
+        alias = rng.choice(rows[row_id][0].split(", "))
+        if kind < 0.4:
+            query = alias
+        elif kind < 0.6:
+            query = alias.upper().replace(" ", "  ")
+        elif kind < 0.8:
+            query = alias.replace("세팅", "준비").replace("장비", "기구").replace("방법", "절차")
+        else:
+            query = _typo(rng, alias)
+        if hard_rng.random() < hard_share:
+            query = _reorder(hard_rng, alias) if hard_rng.random() < 0.5 else _partial(hard_rng, alias)
+        queries.append((query, row_id, alias))
+    return queries
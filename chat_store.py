@@ -0,0 +1,77 @@
+# 채팅 기록 저장소 (SQLite, WAL 모드)
+# 메시지는 추가만 하며(append-only) 한 번씩만 저장합니다. 사이드바에는 제목/시각만 페이지 단위로 읽고,
+# 메시지 내용은 해당 대화를 열 때만 읽습니다.
+from sqlite_db import connect, init_db
+
+
+class ChatStore:
+    def __init__(self, path):
+        self.path = path
+        init_db(path, [
+            "CREATE TABLE IF NOT EXISTS chats ("
+            " chat_id TEXT PRIMARY KEY,"
+            " user TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " datetime TEXT NOT NULL)", # '%Y-%m-%d %H:%M:%S' - 문자열 순서 = 시간 순서
+            "CREATE INDEX IF NOT EXISTS idx_chats_user_datetime ON chats (user, datetime)",
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " message_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id TEXT NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " image_url TEXT)",
+            "CREATE INDEX IF NOT EXISTS idx_messages_chat ON messages (chat_id, message_id)",
+        ], wal=True)
+
+    def _connect(self):
+        return connect(self.path)
+
+    def create_chat(self, user, chat_id, title, log_datetime):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO chats (chat_id, user, title, datetime) VALUES (?, ?, ?, ?)",
+                (chat_id, user, title, log_datetime),
+            )
+
+    def append_message(self, chat_id, message):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO messages (chat_id, role, content, image_url) VALUES (?, ?, ?, ?)",
+                (chat_id, message["role"], message["content"], message.get("image_url")),
+            )
+
+    def count_chats(self, user):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chats WHERE user = ?", (user,)).fetchone()[0]
+
+    def list_chats(self, user, limit=10, offset=0):
+        # 최신 대화부터 (chat_id, 제목, 시각)만 반환합니다.
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT chat_id, title, datetime FROM chats WHERE user = ?"
+                " ORDER BY datetime DESC, chat_id DESC LIMIT ? OFFSET ?",
+                (user, limit, offset),
+            ).fetchall()
+
+    def load_messages(self, user, chat_id):
+        # 다른 사용자의 대화는 읽지 않습니다.
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT role, content, image_url FROM messages"
+                " WHERE chat_id = ? AND EXISTS (SELECT 1 FROM chats WHERE chat_id = ? AND user = ?)"
+                " ORDER BY message_id",
+                (chat_id, chat_id, user),
+            ).fetchall()
+        messages = []
+        for role, content, image_url in rows:
+            message = {"role": role, "content": content}
+            if role == "assistant":
+                message["image_url"] = image_url
+            messages.append(message)
+        return messages
+
+    def delete_chat(self, user, chat_id):
+        # 자기 대화만 지웁니다.
+        with self._connect() as conn:
+            if conn.execute("DELETE FROM chats WHERE chat_id = ? AND user = ?", (chat_id, user)).rowcount:
+                conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
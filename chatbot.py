@@ -1,5 +1,4 @@
 # pip install openai gspread google-auth rapidfuzz
-from openai import OpenAI
 import streamlit as st
 import pandas as pd
 import gspread
@@ -7,7 +6,10 @@ from google.oauth2 import service_account
 import json
 import os
 import re
-from rapidfuzz import process, fuzz
+import time
+from llm_gateway import LLMGateway
+from match_index import MatchIndex, find_best_match
+from streaming import render_stream
 
 # 로그인 상태 관리
 if "login" not in st.session_state:
@@ -80,27 +82,32 @@ if "PERPLEXITY_API_KEY" not in st.secrets:
     st.info("📝 .streamlit/secrets.toml 파일에 API 키를 추가해주세요.")
     st.stop()
 
-client = OpenAI(
-    api_key=st.secrets["PERPLEXITY_API_KEY"],
-    base_url="https://api.perplexity.ai"
+# Perplexity 호출 게이트웨이 (프로세스 공용 연결 풀 + 시간 제한, llm_gateway.py)
+# 인자가 같으면 같은 게이트웨이를 돌려주므로 rerun마다 연결 풀을 새로 만들지 않습니다.
+@st.cache_resource
+def get_llm_gateway(api_key, base_url, first_token_timeout, total_timeout):
+    return LLMGateway(api_key, base_url, first_token_timeout=first_token_timeout, total_timeout=total_timeout)
+
+llm_gateway = get_llm_gateway(
+    st.secrets["PERPLEXITY_API_KEY"],
+    st.secrets.get("PERPLEXITY_BASE_URL", "https://api.perplexity.ai"),
+    float(st.secrets.get("LLM_FIRST_TOKEN_TIMEOUT", 10)), # 초
+    float(st.secrets.get("LLM_TOTAL_TIMEOUT", 60)), # 초
 )
 
 if "perplexity_model" not in st.session_state:
     st.session_state["perplexity_model"] = "sonar-pro"
 
-# RapidFuzz로 유사도 기반 질문 매칭 함수 (임계값 60~70)
-def find_best_match(user_input, questions, threshold=65):
-    if not questions:
-        return None, 0, -1
-    result = process.extractOne(user_input, questions, scorer=fuzz.ratio)
-    if result and result[1] >= threshold:
-        return result[0], result[1], result[2]
-    return None, result[1] if result else 0, result[2] if result else -1
+# 질문 목록이 바뀔 때만 매칭 인덱스를 새로 만들고, 나머지 rerun에서는 재사용합니다.
+@st.cache_resource
+def build_match_index(questions):
+    return MatchIndex(questions)
 
 # 질문-답변 리스트 생성 및 안내
 questions = []
 answers = []
 image_urls = [] # 이미지 URL 리스트 초기화
+match_index = None
 
 if sheet_data is not None:
     if '질문' in sheet_data.columns and '답변' in sheet_data.columns:
@@ -117,6 +124,7 @@ if sheet_data is not None:
         
         if not questions:
             st.info("ℹ️ 구글 시트에 등록된 질문이 없습니다. 시트에 질문/답변 데이터를 추가해 주세요.")
+        match_index = build_match_index(tuple(questions))
     else:
         st.info("ℹ️ 구글 시트에 '질문', '답변' 컬럼이 없습니다. 시트 구조를 확인해 주세요.")
 else:
@@ -168,7 +176,7 @@ if prompt := st.chat_input("무엇을 도와드릴까요?"):
                 "image_url": None
             })
         else:
-            best_match, score, idx = find_best_match(prompt, questions)
+            best_match, score, idx = find_best_match(prompt, match_index)
             if best_match is not None and idx != -1:
                 answer_from_sheet = answers[idx]
                 
@@ -181,11 +189,7 @@ if prompt := st.chat_input("무엇을 도와드릴까요?"):
                     {"role": "user", "content": prompt}
                 ]
                 
-                stream = client.chat.completions.create(
-                    model=st.session_state["perplexity_model"],
-                    messages=messages_for_perplexity,
-                    stream=True,
-                )
+                request_started_at = time.perf_counter()
                 
                 response_from_perplexity = ""
                 with st.chat_message("assistant", avatar="ori_icon.png"):
@@ -196,12 +200,18 @@ if prompt := st.chat_input("무엇을 도와드릴까요?"):
                         st.image(image_path_to_display, caption="수술방 장비 세팅 예시", use_container_width=True)
                     
                     message_placeholder = st.empty()
-                    for chunk in stream:
-                        if chunk.choices[0].delta.content is not None:
-                            response_from_perplexity += chunk.choices[0].delta.content
-                            message_placeholder.markdown(response_from_perplexity + "▌")
-                    
-                    message_placeholder.markdown(response_from_perplexity)
+                    try:
+                        stream = llm_gateway.open_chat_stream(st.session_state["perplexity_model"], messages_for_perplexity)
+                        # 청크를 모아 50ms마다 한 번씩만 화면을 갱신합니다.
+                        response_from_perplexity, stream_stats = render_stream(
+                            stream, message_placeholder, started_at=request_started_at
+                        )
+                        st.session_state["last_stream_stats"] = stream_stats
+                    except Exception as e:
+                        # 연결 실패나 시간 제한 초과 시 시트 원문을 답변으로 남깁니다.
+                        response_from_perplexity = answer_from_sheet
+                        message_placeholder.markdown(response_from_perplexity)
+                        st.warning(f"⚠️ 답변 생성이 중단되었습니다: {type(e).__name__}")
                 
                 st.session_state.messages.append({
                     "role": "assistant",
@@ -0,0 +1,123 @@
+# Perplexity 프롬프트에 넣을 정보(context) 압축
+# 매칭된 답변 셀 전체를 그대로 붙이면 긴 답변(기구 목록 등)이 매 턴 입력 토큰을 늘려 지연 시간과 비용이 커지므로,
+# 답변을 단락/줄 단위로 나눠 질문과 관련 있는 순서로 고르고 토큰 예산 안에 들어가는 만큼만 보냅니다.
+# 예산이 남으면 점수 차이가 작은 다른 행(차순위 후보)의 답변도 함께 보냅니다.
+#
+# 토큰 수는 모델 토크나이저 없이 어림합니다. (실제 전송된 토큰 수는 스트림의 usage.prompt_tokens로 기록)
+import math
+import re
+
+from rapidfuzz import fuzz, process
+
+from match_index import normalize_text
+
+_BLANK_LINE_RE = re.compile(r"\n\s*\n")
+_ASCII_RE = re.compile(r"[\x00-\x7f]")
+MIN_RUNNER_UP_TOKENS = 30 # 남은 예산이 이보다 적으면 다른 행을 붙이지 않음 (잘린 조각만 보내지 않도록)
+
+
+def estimate_tokens(text):
+    # 영문/숫자/기호는 약 4글자당 1토큰, 한글 등 그 외 글자는 1글자당 1토큰으로 어림합니다. (실제보다 약간 크게 잡음)
+    ascii_chars = len(_ASCII_RE.findall(text))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def split_sections(answer):
+    # 빈 줄로 나뉜 단락 안에서 다시 줄 단위로 나눕니다. 순서는 원래 답변 순서를 유지합니다.
+    # 마크다운 표('|'로 시작하는 연속된 줄)는 머리글이 떨어지지 않도록 한 덩어리로 둡니다.
+    sections = []
+    for block in _BLANK_LINE_RE.split(str(answer).strip()):
+        table = []
+        for line in block.splitlines():
+            line = line.strip()
+            if line.startswith("|"):
+                table.append(line)
+                continue
+            if table:
+                sections.append("\n".join(table))
+                table = []
+            if line:
+                sections.append(line)
+        if table:
+            sections.append("\n".join(table))
+    return sections
+
+
+def _truncate_to_budget(text, token_budget):
+    # 한 줄이 예산보다 길 때 앞부분만 남깁니다.
+    while text and estimate_tokens(text) > token_budget:
+        text = text[:max(1, int(len(text) * token_budget / estimate_tokens(text)) - 1)]
+    return text
+
+
+def select_sections(prompt, answer, token_budget):
+    # (고른 줄 목록, 전체 줄 수, 사용한 토큰 수)
+    # 첫 줄(답변 제목/요약)은 항상 넣고, 나머지는 질문과의 유사도 순으로 예산에 들어가는 만큼 넣은 뒤 원래 순서로 되돌립니다.
+    sections = split_sections(answer)
+    if not sections or token_budget <= 0:
+        return [], len(sections), 0
+
+    head = _truncate_to_budget(sections[0], token_budget)
+    used = estimate_tokens(head)
+    chosen = {0: head}
+    if len(sections) > 1:
+        scores = process.cdist(
+            [normalize_text(prompt)],
+            [normalize_text(section) for section in sections[1:]],
+            scorer=fuzz.partial_ratio,
+        )[0]
+        # 점수가 같으면 앞쪽 줄을 먼저 고릅니다.
+        for i in sorted(range(len(scores)), key=lambda i: (-scores[i], i)):
+            cost = estimate_tokens(sections[i + 1]) + 1 # 줄바꿈
+            if used + cost <= token_budget:
+                chosen[i + 1] = sections[i + 1]
+                used += cost
+    return [chosen[i] for i in sorted(chosen)], len(sections), used
+
+
+def find_runner_ups(prompt, match_index, alias_rows, best_idx, best_score, score_delta=5, limit=2):
+    # 1순위와 점수 차이가 score_delta 이내인 다른 행의 (별칭 인덱스, 점수) 목록
+    # 별칭은 같은 행을 여러 번 가리키므로 행 번호(alias_rows)로 중복을 제거합니다.
+    if limit <= 0:
+        return []
+    seen_rows = {alias_rows[best_idx]}
+    runner_ups = []
+    for _, score, idx in match_index.search(prompt, limit=limit * 8 + 1):
+        if score < best_score - score_delta or len(runner_ups) >= limit:
+            break
+        if alias_rows[idx] in seen_rows:
+            continue
+        seen_rows.add(alias_rows[idx])
+        runner_ups.append((idx, score))
+    return runner_ups
+
+
+def pack_context(prompt, answer, token_budget=800, runner_up_answers=()):
+    # (정보 텍스트, 통계)를 반환합니다. 정보 텍스트의 어림 토큰 수는 token_budget을 넘지 않습니다.
+    # runner_up_answers: [(질문, 답변), ...] - 본 답변을 담고 남은 예산으로만 추가합니다.
+    # 통계: context_tokens(어림), sections_sent/sections_total, runner_ups(추가된 다른 행 수)
+    lines, sections_total, used = select_sections(prompt, answer, token_budget)
+    sections_sent = len(lines)
+    runner_ups = 0
+    for question, runner_up_answer in runner_up_answers:
+        header = f"\n[참고: {question}]"
+        remaining = token_budget - used - estimate_tokens(header) - 1
+        if remaining < MIN_RUNNER_UP_TOKENS:
+            break
+        runner_up_lines, runner_up_total, runner_up_used = select_sections(prompt, runner_up_answer, remaining)
+        if not runner_up_lines:
+            break
+        lines.append(header)
+        lines.extend(runner_up_lines)
+        used += estimate_tokens(header) + 1 + runner_up_used
+        sections_total += runner_up_total
+        sections_sent += len(runner_up_lines)
+        runner_ups += 1
+
+    context = "\n".join(lines)
+    return context, {
+        "context_tokens": estimate_tokens(context),
+        "sections_sent": sections_sent,
+        "sections_total": sections_total,
+        "runner_ups": runner_ups,
+    }
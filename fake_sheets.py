@@ -0,0 +1,46 @@
+# 로컬 개발/벤치마크용 가짜 구글 시트 클라이언트
+# gspread의 Spreadsheet/Worksheet 중 이 앱이 사용하는 메서드만 흉내 냅니다.
+# FakeSpreadsheet는 sheets_gateway.SheetsGateway 대신 그대로 사용할 수 있습니다.
+# JSON 픽스처 형식: {"Sheet1": [[헤더...], [값...], ...], "Data_Input": [...], ...}
+import json
+
+import gspread
+
+
+class FakeWorksheet:
+    def __init__(self, title, values):
+        self.title = title
+        self._values = [list(row) for row in values]
+
+    def get_all_values(self):
+        return [list(row) for row in self._values]
+
+    def append_row(self, row, **kwargs):
+        self._values.append(["" if v is None else str(v) for v in row])
+
+    def append_rows(self, rows, **kwargs):
+        for row in rows:
+            self.append_row(row)
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheet_values):
+        self._worksheets = {
+            title: FakeWorksheet(title, values)
+            for title, values in sheet_values.items()
+            if values is not None
+        }
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def worksheet(self, title):
+        try:
+            return self._worksheets[title]
+        except KeyError:
+            raise gspread.exceptions.WorksheetNotFound(title)
+
+    def run(self, fn, *args):
+        return fn(self, *args)
@@ -0,0 +1,89 @@
+# 채팅 화면용 축소 이미지(WebP) 생성 및 캐시
+# images/ 폴더의 원본을 업로드 시점(또는 처음 표시될 때) 한 번만 가로 폭별 WebP로 줄여 저장하고,
+# 자주 쓰는 이미지 바이트는 메모리 LRU에 보관합니다. 기본 표시는 썸네일, 원본은 요청 시에만 보냅니다.
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+VARIANT_WIDTHS = (480, 960)
+THUMBNAIL_WIDTH = 480
+
+
+class ImageVariants:
+    def __init__(self, image_dir, variant_dir, widths=VARIANT_WIDTHS, quality=80,
+                 max_cache_bytes=64 * 1024 * 1024):
+        self.image_dir = image_dir
+        self.variant_dir = variant_dir
+        self.widths = tuple(widths)
+        self.quality = quality
+        self.max_cache_bytes = max_cache_bytes
+        self._cache = OrderedDict() # (파일 이름, 폭, 원본 수정 시각) -> bytes
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def source_path(self, filename):
+        return os.path.join(self.image_dir, filename)
+
+    def exists(self, filename):
+        return bool(filename) and os.path.exists(self.source_path(filename))
+
+    def variant_path(self, filename, width):
+        # 확장자까지 넣어야 room37.png와 room37.jpg의 변형이 서로 덮어쓰지 않습니다.
+        return os.path.join(self.variant_dir, f"{filename}_{width}w.webp")
+
+    def _encode(self, source, width):
+        with Image.open(source) as img:
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if img.mode in ("P", "LA", "PA") else "RGB")
+            if img.width > width:
+                # 더 작게만 줄이고 키우지는 않습니다.
+                img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format="WEBP", quality=self.quality, method=4)
+            return buffer.getvalue()
+
+    def _ensure_variant(self, filename, width):
+        source = self.source_path(filename)
+        target = self.variant_path(filename, width)
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            os.makedirs(self.variant_dir, exist_ok=True)
+            data = self._encode(source, width)
+            # 다른 세션이 반쯤 쓰인 파일을 읽지 않도록 임시 파일에 쓴 뒤 교체합니다.
+            tmp_path = f"{target}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        return target
+
+    def generate(self, filename):
+        # 업로드 직후 호출해서 모든 폭의 변형을 미리 만들어 둡니다.
+        for width in self.widths:
+            self._ensure_variant(filename, width)
+
+    def get(self, filename, width=THUMBNAIL_WIDTH):
+        # width=None이면 원본 바이트를 반환합니다. 원본이 없으면 None.
+        if not self.exists(filename):
+            return None
+        source = self.source_path(filename)
+        key = (filename, width, os.path.getmtime(source))
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                return data
+
+        path = source if width is None else self._ensure_variant(filename, width)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = data
+                self._cache_bytes += len(data)
+            while self._cache_bytes > self.max_cache_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+        return data
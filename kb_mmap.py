@@ -0,0 +1,282 @@
+# 지식 베이스 + 매칭 인덱스를 메모리 매핑(mmap)용 단일 파일로 저장/열기
+# 한 서버에서 Streamlit 프로세스를 여러 개 띄우면 프로세스마다 시트를 읽고 같은 구조를 따로 만들어 메모리를 씁니다.
+# 한 번 만든 지식 베이스를 읽기 전용 파일로 저장해 두면, 모든 프로세스가 같은 파일을 np.memmap으로 열어
+# OS 페이지 캐시의 같은 페이지를 공유합니다. 여는 데는 헤더만 읽으므로 밀리초 단위이고,
+# 문자열은 필요한 것만 그때그때 디코딩하므로 시트가 커져도 프로세스별 메모리는 거의 늘지 않습니다.
+#
+# 파일 형식 (리틀 엔디언):
+#   MAGIC(8바이트) | 헤더 길이(uint64) | 헤더 JSON | 64바이트 정렬된 배열들
+#   헤더: 배열별 (dtype, shape, 데이터 시작 기준 오프셋)과 메타 정보(kb_version, 안내 문구, 동의어 사전 등)
+#   문자열 목록: <이름>.offsets(int64, 길이+1) + <이름>.data(UTF-8 바이트를 이어 붙인 영역)
+#   n-gram 어휘: 정렬된 고정 길이 바이트 배열 - 질의 n-gram은 np.searchsorted로 찾습니다.
+#   TF-IDF 행렬: CSC 형식의 data/indices/indptr 배열 (열 순서 = 정렬된 어휘 순서)
+# 새 파일은 임시 파일에 쓴 뒤 os.replace로 교체하므로, 이미 열어 둔 프로세스는 이전 파일을 끝까지 안전하게 읽습니다.
+#
+# 사용법 (배포/크론에서 미리 만들기):
+#   python kb_mmap.py                                    # data/kb_snapshot.sqlite3 -> data/kb_index.bin
+#   python kb_mmap.py --fixture benchmarks/fixture.json --output /tmp/kb_index.bin
+import argparse
+import json
+import operator
+import os
+import sys
+import tempfile
+import time
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from semantic_index import HybridMatchIndex, NgramVectorIndex, char_ngrams
+from synonyms import SynonymCanonicalizer
+
+MAGIC = b"ORIKB001"
+ALIGNMENT = 64
+STRING_FIELDS = ('questions', 'normalized_questions', 'row_answers', 'row_image_urls', 'row_hashes')
+
+
+class StringArena(Sequence):
+    # offsets + UTF-8 바이트 영역으로 된 읽기 전용 문자열 목록
+    # '정보 저장'으로 추가된 별칭/행은 파일을 다시 만들 때까지 tail(메모리)에 붙여 둡니다.
+    def __init__(self, offsets, data, tail=()):
+        self.offsets = offsets
+        self.data = data
+        self.tail = tuple(tail)
+        self._size = len(offsets) - 1
+
+    def __len__(self):
+        return self._size + len(self.tail)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = operator.index(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i >= self._size:
+            return self.tail[i - self._size]
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __add__(self, other):
+        return StringArena(self.offsets, self.data, self.tail + tuple(other))
+
+
+class ArenaMapping(Mapping):
+    # 행 번호(0..n-1) -> 문자열 (row_hashes를 dict 없이 읽기 위한 읽기 전용 매핑)
+    def __init__(self, strings):
+        self._strings = strings
+
+    def __getitem__(self, key):
+        if not isinstance(key, (int, np.integer)) or not 0 <= key < len(self._strings):
+            raise KeyError(key)
+        return self._strings[key]
+
+    def __iter__(self):
+        return iter(range(len(self._strings)))
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class MappedNgramVectorIndex(NgramVectorIndex):
+    # 어휘를 dict 대신 정렬된 바이트 배열(mmap)로 들고 있는 NgramVectorIndex
+    def __init__(self, vocabulary, idf, matrix):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.matrix = matrix
+
+    def _query_weights(self, text):
+        counts = char_ngrams(text)
+        if not counts or len(self.vocabulary) == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        grams = np.array([g.encode("utf-8") for g in counts], dtype=self.vocabulary.dtype)
+        positions = np.minimum(np.searchsorted(self.vocabulary, grams), len(self.vocabulary) - 1)
+        # 어휘 폭보다 긴 n-gram은 잘린 채로 비교되지 않도록 원래 길이도 확인합니다.
+        found = (self.vocabulary[positions] == grams) & np.array(
+            [len(g.encode("utf-8")) <= self.vocabulary.dtype.itemsize for g in counts])
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return positions[found].astype(np.int32), values[found]
+
+
+def _string_arena_arrays(strings):
+    encoded = [str(s).encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def kb_file_arrays(kb):
+    # 지식 베이스 -> (배열 dict, 메타 dict). match_index는 HybridMatchIndex여야 합니다.
+    match_index = kb['match_index']
+    if not isinstance(match_index, HybridMatchIndex):
+        raise TypeError(f"{type(match_index).__name__}는 파일로 저장할 수 없습니다 (HybridMatchIndex만 지원)")
+    vectors = match_index.vectors
+
+    arrays = {'alias_rows': np.asarray(kb['alias_rows'], dtype=np.int32)}
+    strings = {
+        'questions': kb['questions'],
+        'normalized_questions': match_index.normalized_questions,
+        'row_answers': kb['row_answers'],
+        'row_image_urls': kb['row_image_urls'],
+        'row_hashes': [kb['row_hashes'][row_id] for row_id in range(len(kb['row_answers']))],
+    }
+    for name, values in strings.items():
+        arrays[f'{name}.offsets'], arrays[f'{name}.data'] = _string_arena_arrays(values)
+
+    # 어휘를 바이트 순서로 정렬하고, 행렬 열과 IDF도 같은 순서로 맞춥니다. (searchsorted로 찾을 수 있도록)
+    if isinstance(vectors.vocabulary, dict):
+        grams = [None] * len(vectors.vocabulary)
+        for gram, col in vectors.vocabulary.items():
+            grams[col] = gram.encode("utf-8")
+        vocabulary = np.array(grams, dtype=f"S{max([len(g) for g in grams] + [1])}")
+    else:
+        vocabulary = np.asarray(vectors.vocabulary)
+    order = np.argsort(vocabulary, kind="stable")
+    matrix = sparse.csc_matrix(vectors.matrix)[:, order]
+    matrix.sort_indices()
+    arrays['vocabulary'] = vocabulary[order]
+    arrays['idf'] = np.asarray(vectors.idf, dtype=np.float32)[order]
+    arrays['matrix.data'] = matrix.data.astype(np.float32)
+    arrays['matrix.indices'] = matrix.indices
+    arrays['matrix.indptr'] = matrix.indptr
+
+    canonicalizer = match_index.canonicalizer
+    meta = {
+        'kb_version': kb['kb_version'],
+        'notices': [list(notice) for notice in kb['notices']],
+        'synonym_map': canonicalizer.synonym_map if canonicalizer is not None else None,
+        'use_jamo': match_index.use_jamo,
+        'candidates': match_index.candidates,
+        'matrix_shape': list(matrix.shape),
+    }
+    return arrays, meta
+
+
+def write_kb_file(path, kb, sheet_version=None):
+    arrays, meta = kb_file_arrays(kb)
+    meta['sheet_version'] = sheet_version
+    meta['built_at'] = time.time()
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({'meta': meta, 'arrays': layout}, ensure_ascii=False).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=".kb_index.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.array(len(header), dtype='<u8').tobytes())
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + layout[name]['offset'])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return meta
+
+
+def open_kb_file(path):
+    # (지식 베이스 dict, 메타 dict)를 반환합니다. 배열은 모두 읽기 전용 mmap 뷰입니다.
+    # 형식이 맞지 않으면 ValueError, 파일이 없으면 OSError.
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+    if len(mm) < len(MAGIC) + 8 or mm[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError(f"지식 베이스 파일 형식이 아닙니다: {path}")
+    header_len = int(mm[len(MAGIC):len(MAGIC) + 8].view('<u8')[0])
+    header = json.loads(mm[len(MAGIC) + 8:len(MAGIC) + 8 + header_len].tobytes().decode("utf-8"))
+    data_start = _align(len(MAGIC) + 8 + header_len)
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = data_start + spec['offset']
+        arrays[name] = mm[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+    meta = header['meta']
+
+    strings = {name: StringArena(arrays[f'{name}.offsets'], arrays[f'{name}.data']) for name in STRING_FIELDS}
+    matrix = sparse.csc_matrix(
+        (arrays['matrix.data'], arrays['matrix.indices'], arrays['matrix.indptr']),
+        shape=tuple(meta['matrix_shape']), copy=False,
+    )
+    canonicalizer = SynonymCanonicalizer(meta['synonym_map']) if meta['synonym_map'] is not None else None
+
+    # 질문 정규화/벡터화는 파일을 만들 때 끝났으므로 생성자를 거치지 않고 저장된 값으로 인덱스를 채웁니다.
+    match_index = HybridMatchIndex.__new__(HybridMatchIndex)
+    match_index.questions = strings['questions']
+    match_index.use_jamo = meta['use_jamo']
+    match_index.canonicalizer = canonicalizer
+    match_index.normalized_questions = strings['normalized_questions']
+    match_index.candidates = meta['candidates']
+    match_index.vectors = MappedNgramVectorIndex(arrays['vocabulary'], arrays['idf'], matrix)
+
+    kb = {
+        'questions': strings['questions'],
+        'alias_rows': arrays['alias_rows'],
+        'row_answers': strings['row_answers'],
+        'row_image_urls': strings['row_image_urls'],
+        'row_hashes': ArenaMapping(strings['row_hashes']),
+        'kb_version': meta['kb_version'],
+        'match_index': match_index,
+        'notices': [tuple(notice) for notice in meta['notices']],
+    }
+    return kb, meta
+
+
+def main():
+    # 순환 import를 피하려고 CLI에서만 불러옵니다. (knowledge_base가 이 모듈을 사용)
+    from kb_snapshot import load_snapshot
+    from knowledge_base import build_knowledge_base
+
+    data_dir = os.environ.get("ORI_DATA_DIR", "data")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", default=os.path.join(data_dir, "kb_snapshot.sqlite3"))
+    parser.add_argument("--fixture", help="스냅샷 대신 읽을 시트 JSON 픽스처 (fake_sheets.py 형식)")
+    parser.add_argument("--output", default=os.path.join(data_dir, "kb_index.bin"))
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, encoding="utf-8") as f:
+            sheet_values = json.load(f)
+    else:
+        snapshot = load_snapshot(args.snapshot)
+        if snapshot is None:
+            print(f"스냅샷이 없습니다: {args.snapshot} (앱을 한 번 실행하거나 --fixture를 지정하세요)")
+            return 1
+        sheet_values = snapshot[0]
+
+    started = time.perf_counter()
+    kb = build_knowledge_base(sheet_values)
+    built = time.perf_counter()
+    write_kb_file(args.output, kb)
+    written = time.perf_counter()
+    opened_kb, _ = open_kb_file(args.output)
+    opened = time.perf_counter()
+    print(f"{len(opened_kb['questions'])} aliases, {len(opened_kb['row_answers'])} rows -> {args.output} "
+          f"({os.path.getsize(args.output) / 1e6:.1f} MB; build {built - started:.2f}s, "
+          f"write {written - built:.2f}s, open {(opened - written) * 1000:.1f}ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
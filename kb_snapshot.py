@@ -0,0 +1,46 @@
+# 지식 베이스 로컬 스냅샷 (SQLite)
+# 시트를 성공적으로 읽을 때마다 탭별 원본 값(get_all_values 결과)을 저장해 두고,
+# 앱이 재시작되면 구글 API를 기다리지 않고 이 스냅샷으로 먼저 시작합니다.
+# 가공된 결과가 아니라 원본 값을 저장하므로 매칭 로직이 바뀌어도 스냅샷은 그대로 쓸 수 있습니다.
+import json
+import os
+import sqlite3
+import time
+
+from sqlite_db import connect, init_db
+
+SNAPSHOT_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS sheet_values (sheet_name TEXT PRIMARY KEY, values_json TEXT)",
+    "CREATE TABLE IF NOT EXISTS snapshot_meta (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+
+def save_snapshot(path, sheet_values):
+    init_db(path, SNAPSHOT_SCHEMA)
+    # 하나의 트랜잭션으로 교체하므로 읽는 쪽은 항상 완전한 스냅샷만 보게 됩니다.
+    with connect(path) as conn:
+        conn.execute("DELETE FROM sheet_values")
+        conn.executemany(
+            "INSERT INTO sheet_values (sheet_name, values_json) VALUES (?, ?)",
+            [(name, json.dumps(values, ensure_ascii=False)) for name, values in sheet_values.items()],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO snapshot_meta (key, value) VALUES ('saved_at', ?)",
+            (str(time.time()),),
+        )
+
+
+def load_snapshot(path):
+    # (탭별 원본 값, 저장 시각)을 반환합니다. 스냅샷이 없거나 읽을 수 없으면 None.
+    if not os.path.exists(path):
+        return None
+    try:
+        init_db(path, SNAPSHOT_SCHEMA)
+        with connect(path) as conn:
+            rows = conn.execute("SELECT sheet_name, values_json FROM sheet_values").fetchall()
+            saved_at = conn.execute("SELECT value FROM snapshot_meta WHERE key = 'saved_at'").fetchone()
+    except sqlite3.Error:
+        return None
+    if not rows or saved_at is None:
+        return None
+    return {name: json.loads(values_json) for name, values_json in rows}, float(saved_at[0])
@@ -0,0 +1,317 @@
+# 구글 시트 원본 값 -> 매칭용 지식 베이스(knowledge base) 변환과 프로세스 공용 저장소
+# 이 모듈은 streamlit을 사용하지 않습니다. 화면에 표시할 안내 문구는 kb['notices']로 돌려주고,
+# 표시는 newchatbot.py가 담당합니다. (백그라운드 스레드에서도 호출할 수 있도록)
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import gspread
+import numpy as np
+import pandas as pd
+
+from answer_cache import content_hash
+from kb_mmap import open_kb_file, write_kb_file
+from kb_snapshot import load_snapshot, save_snapshot
+from semantic_index import HybridMatchIndex
+from synonyms import (SYNONYM_MAP, SYNONYM_SHEET_NAME, SynonymCanonicalizer,
+                      merge_synonym_maps, synonym_map_from_rows)
+
+MAIN_SHEET_NAME = 'Sheet1'
+INPUT_SHEET_NAME = 'Data_Input'
+KB_COLUMNS = ['질문', '답변', 'Image URL']
+
+# 저장소가 현재 가리키는 지식 베이스와 그 출처를 묶은 핸들. 한 번의 대입으로 통째로 교체되므로
+# rerun은 핸들 하나만 읽으면 지식 베이스/출처/로딩 시각이 서로 다른 버전에서 섞여 보이지 않습니다.
+# generation은 교체될 때마다 1씩 늘어납니다.
+KnowledgeBaseHandle = namedtuple('KnowledgeBaseHandle', ['generation', 'kb', 'source', 'loaded_at'])
+
+
+def fetch_sheet_values(sh):
+    # 스프레드시트에서 필요한 탭의 값을 그대로 가져옵니다. (없는 선택 탭은 None)
+    values = {MAIN_SHEET_NAME: sh.worksheet(MAIN_SHEET_NAME).get_all_values()}
+    for sheet_name in (INPUT_SHEET_NAME, SYNONYM_SHEET_NAME):
+        try:
+            values[sheet_name] = sh.worksheet(sheet_name).get_all_values()
+        except gspread.exceptions.WorksheetNotFound:
+            values[sheet_name] = None
+    return values
+
+
+def split_aliases(question_cell):
+    # '질문' 칸은 콤마로 구분된 여러 질문(별칭)을 담을 수 있습니다.
+    return [q.strip() for q in str(question_cell).split(',') if q.strip()]
+
+
+def ingest_rows(combined_df):
+    # 합친 시트 행 -> (별칭 목록, 별칭별 행 번호 배열, 행별 답변, 행별 이미지, 행 번호 -> 내용 해시)
+    # 행 테이블: 답변/이미지는 행마다 한 번만 저장합니다. (행 번호 = 리스트 위치)
+    # 별칭 테이블: 별칭 문자열과 그 별칭이 나온 행 번호(numpy 배열)
+    # 행마다 파이썬 루프(iterrows)를 돌지 않고 split/explode/strip을 열 단위로 한 번에 처리합니다.
+    # 없는 컬럼은 빈 값으로 채워 컬럼 검사는 여기서 한 번만 합니다.
+    # 시트 머리글이 겹치면(빈 머리글 칸 여러 개 등) reindex가 실패하므로 같은 이름은 첫 컬럼만 남깁니다.
+    df = combined_df.loc[:, ~combined_df.columns.duplicated()]
+    df = df.reset_index(drop=True).reindex(columns=KB_COLUMNS, fill_value='').fillna('').astype(str)
+
+    aliases = df['질문'].str.split(',').explode().str.strip()
+    aliases = aliases[aliases != '']
+
+    row_answers = df['답변'].tolist()
+    row_image_urls = df['Image URL'].tolist()
+    row_hashes = {
+        row_id: content_hash(answer_cell, image_url_cell)
+        for row_id, (answer_cell, image_url_cell) in enumerate(zip(row_answers, row_image_urls))
+    }
+    return aliases.tolist(), aliases.index.to_numpy(dtype=np.int32), row_answers, row_image_urls, row_hashes
+
+
+def build_knowledge_base(sheet_values, index_class=HybridMatchIndex):
+    # index_class: 질문 매칭 인덱스 (기본은 n-gram 후보 검색 + RapidFuzz 재정렬, match_index.MatchIndex는 전체 fuzz.ratio 비교)
+    notices = [] # (레벨, 메시지) - st.info / st.warning 으로 표시
+
+    data_main = sheet_values.get(MAIN_SHEET_NAME) or []
+    df_main = pd.DataFrame(data_main[1:], columns=data_main[0]) if data_main else pd.DataFrame()
+
+    # --- Data_Input 시트 --- (합치는 데만 쓰고 지식 베이스에는 남기지 않음)
+    df_input_full = pd.DataFrame()
+    data_input = sheet_values.get(INPUT_SHEET_NAME)
+    if data_input is None:
+        notices.append(("warning", "⚠️ 'Data_Input' 시트를 찾을 수 없습니다. 새로운 정보를 저장하려면 시트를 생성해주세요."))
+        combined_df = df_main # Data_Input이 없으면 기존 Sheet1만 사용
+    else:
+        if data_input: # 데이터가 있을 경우에만 DataFrame 생성
+            df_input_full = pd.DataFrame(data_input[1:], columns=data_input[0])
+        else:
+            notices.append(("info", "ℹ️ 'Data_Input' 시트에 데이터가 없습니다. 새로운 정보를 입력해주세요."))
+
+        # --- 여기에서 '질문', '답변', 'Image URL' 컬럼을 합치는 로직은 그대로 유지 ---
+        df_main_filtered = df_main[KB_COLUMNS] if all(col in df_main.columns for col in KB_COLUMNS) else pd.DataFrame(columns=KB_COLUMNS)
+        df_input_filtered = df_input_full[KB_COLUMNS] if all(col in df_input_full.columns for col in KB_COLUMNS) else pd.DataFrame(columns=KB_COLUMNS)
+        combined_df = pd.concat([df_main_filtered, df_input_filtered], ignore_index=True)
+
+    # --- 동의어 사전: 기본 사전에 'Synonyms' 탭(대표어, 동의어) 내용을 더합니다 ---
+    synonym_map = merge_synonym_maps(SYNONYM_MAP, synonym_map_from_rows(sheet_values.get(SYNONYM_SHEET_NAME)))
+    canonicalizer = SynonymCanonicalizer(synonym_map)
+
+    if len(combined_df) < 1 or combined_df.empty:
+        notices.append(("warning", "구글 시트에 유효한 데이터가 없습니다. 시트에 '질문', '답변', 'Image URL' 컬럼을 포함해 데이터를 입력해 주세요."))
+
+    questions, alias_rows, row_answers, row_image_urls, row_hashes = ingest_rows(combined_df)
+
+    return freeze_knowledge_base({
+        'questions': questions,
+        'alias_rows': alias_rows,
+        'row_answers': row_answers,
+        'row_image_urls': row_image_urls,
+        'row_hashes': row_hashes,
+        'kb_version': content_hash(*row_hashes.values()),
+        'match_index': index_class(questions, canonicalizer=canonicalizer), # 질문 정규화/동의어 치환은 로딩 시 한 번만 수행
+        'notices': notices,
+    })
+
+
+def freeze_knowledge_base(kb):
+    # 모든 세션이 복사 없이 같은 객체를 참조하므로 읽기 전용으로 만듭니다.
+    # (리스트 -> 튜플, numpy 배열은 쓰기 금지, dict -> 읽기 전용 뷰) 바꿀 때는 항상 새 지식 베이스를 만들어 교체합니다.
+    # kb_mmap 파일에서 연 지식 베이스의 문자열 목록/매핑은 이미 읽기 전용이므로 그대로 둡니다.
+    alias_rows = kb['alias_rows']
+    alias_rows.flags.writeable = False
+    frozen = dict(kb)
+    for key in ('questions', 'row_answers', 'row_image_urls', 'notices'):
+        if isinstance(kb[key], list):
+            frozen[key] = tuple(kb[key])
+    if isinstance(kb['row_hashes'], dict):
+        frozen['row_hashes'] = MappingProxyType(kb['row_hashes'])
+    return MappingProxyType(frozen)
+
+
+def resolve_row(kb, alias_idx):
+    # 매칭된 별칭 위치 -> (행 번호, 답변, 이미지 파일 이름)
+    row_id = int(kb['alias_rows'][alias_idx])
+    return row_id, kb['row_answers'][row_id], kb['row_image_urls'][row_id]
+
+
+def first_alias_by_row(kb):
+    # 행 번호 -> 그 행의 첫 번째 별칭 (별칭이 없는 행은 빠짐)
+    row_ids, first_idx = np.unique(kb['alias_rows'], return_index=True)
+    return {int(row_id): kb['questions'][i] for row_id, i in zip(row_ids, first_idx)}
+
+
+def append_row_to_knowledge_base(kb, question_cell, answer_cell, image_url_cell):
+    # '정보 저장'으로 Data_Input 끝에 추가된 한 행을 전체 재로딩 없이 반영한 새 지식 베이스를 만듭니다.
+    # Data_Input은 항상 마지막에 합쳐지므로 새 행 번호는 기존 행 수와 같습니다.
+    row_id = len(kb['row_answers'])
+    row_hash = content_hash(answer_cell, image_url_cell)
+    aliases = split_aliases(question_cell)
+
+    new_kb = dict(kb)
+    new_kb['questions'] = kb['questions'] + tuple(aliases)
+    new_kb['alias_rows'] = np.concatenate([kb['alias_rows'], np.full(len(aliases), row_id, dtype=np.int32)])
+    new_kb['row_answers'] = kb['row_answers'] + (answer_cell,)
+    new_kb['row_image_urls'] = kb['row_image_urls'] + (image_url_cell,)
+    new_kb['row_hashes'] = {**kb['row_hashes'], row_id: row_hash}
+    new_kb['kb_version'] = content_hash(kb['kb_version'], row_hash)
+    new_kb['match_index'] = kb['match_index'].extended(aliases)
+    return freeze_knowledge_base(new_kb)
+
+
+class KnowledgeBaseStore:
+    # 프로세스 전체에서 하나만 사용하는 지식 베이스 보관소 (stale-while-revalidate)
+    # 1. 시작 시 로컬 스냅샷이 있으면 바로 그 데이터로 앱을 띄우고
+    # 2. 백그라운드 스레드에서 구글 시트를 다시 읽어 새 지식 베이스를 만든 뒤
+    # 3. 참조를 한 번에 교체(swap)하고 스냅샷을 갱신합니다.
+    # 지식 베이스는 읽기 전용이라 rerun은 current 핸들을 복사 없이 참조만 하고, 교체 전에 핸들을 받은 rerun은
+    # 끝날 때까지 이전 버전을 그대로 사용합니다.
+    # 시트 API가 느리거나 장애가 나도 마지막 스냅샷으로 계속 답변할 수 있습니다.
+    # 앱 밖(시트에서 직접)에서 수정된 내용은 reconcile_interval마다 시트 수정 시각을 확인해 맞춥니다.
+    # kb_file_path를 주면 같은 서버의 여러 프로세스가 kb_mmap 파일 하나를 함께 엽니다.
+    # 시트를 다시 읽은 프로세스가 파일을 새로 쓰고, 나머지는 파일이 바뀐 것을 보고 다시 엽니다. (시트를 따로 읽지 않음)
+    def __init__(self, fetch_values, snapshot_path, fetch_version=None, reconcile_interval=300, kb_file_path=None):
+        self.fetch_values = fetch_values # 인자 없이 호출하면 시트 원본 값을 돌려주는 함수 (없으면 스냅샷만 사용)
+        self.fetch_version = fetch_version # 시트 수정 시각(lastUpdateTime)을 돌려주는 함수 (없으면 주기마다 전체 재로딩)
+        self.snapshot_path = snapshot_path
+        self.kb_file_path = kb_file_path
+        self.reconcile_interval = reconcile_interval
+        self.current = KnowledgeBaseHandle(0, None, None, None) # source: 'snapshot' 또는 'sheet'
+        self.sheet_version = None
+        self.last_error = None
+        self._last_checked = time.time()
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._kb_file_identity = None
+
+    def start(self):
+        if self._open_kb_file():
+            # 다른 프로세스(또는 배포 단계)가 만든 파일로 바로 시작하고, 시트 수정 시각이 다를 때만 다시 만듭니다.
+            self.refresh_async(target=self.reconcile)
+            return self
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is not None:
+            sheet_values, saved_at = snapshot
+            self._swap(build_knowledge_base(sheet_values), 'snapshot', saved_at)
+            self.refresh_async()
+        else:
+            # 스냅샷이 없는 첫 실행에는 시트를 읽을 때까지 기다립니다.
+            self.refresh()
+        return self
+
+    @property
+    def kb(self):
+        return self.current.kb
+
+    @property
+    def source(self):
+        return self.current.source
+
+    @property
+    def loaded_at(self):
+        return self.current.loaded_at
+
+    def _swap(self, kb, source, loaded_at):
+        with self._lock:
+            self.current = KnowledgeBaseHandle(self.current.generation + 1, kb, source, loaded_at)
+
+    def _current_kb_file_identity(self):
+        try:
+            stat = os.stat(self.kb_file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _kb_file_changed(self):
+        if self.kb_file_path is None:
+            return False
+        identity = self._current_kb_file_identity()
+        return identity is not None and identity != self._kb_file_identity
+
+    def _open_kb_file(self):
+        if self.kb_file_path is None:
+            return False
+        identity = self._current_kb_file_identity()
+        try:
+            kb, meta = open_kb_file(self.kb_file_path)
+        except (OSError, ValueError, KeyError):
+            return False
+        self._swap(freeze_knowledge_base(kb), 'file', meta['built_at'])
+        self.sheet_version = meta['sheet_version']
+        self._kb_file_identity = identity
+        return True
+
+    def _publish_kb_file(self, kb, sheet_version):
+        # 새로 만든 지식 베이스를 파일로 쓰고 이 프로세스도 파일 쪽으로 교체합니다. (실패하면 False)
+        if self.kb_file_path is None:
+            return False
+        try:
+            write_kb_file(self.kb_file_path, kb, sheet_version=sheet_version)
+        except Exception as e:
+            self.last_error = e
+            return False
+        return self._open_kb_file()
+
+    def refresh(self):
+        if self.fetch_values is None:
+            return False
+        self._last_checked = time.time()
+        try:
+            sheet_version = self.fetch_version() if self.fetch_version is not None else None
+            sheet_values = self.fetch_values()
+            kb = build_knowledge_base(sheet_values)
+        except Exception as e:
+            self.last_error = e
+            return False
+        self.last_error = None
+        if not self._publish_kb_file(kb, sheet_version):
+            self._swap(kb, 'sheet', time.time())
+        self.sheet_version = sheet_version
+        try:
+            save_snapshot(self.snapshot_path, sheet_values)
+        except Exception as e:
+            self.last_error = e
+        return True
+
+    def reconcile(self):
+        # 시트 수정 시각이 마지막으로 읽었을 때와 같으면 다시 읽지 않습니다.
+        self._last_checked = time.time()
+        if self._kb_file_changed():
+            self._open_kb_file() # 다른 프로세스가 이미 새로 만든 파일이면 그 버전과 비교합니다.
+        if self.fetch_version is not None and self.source in ('sheet', 'file'):
+            try:
+                if self.fetch_version() == self.sheet_version:
+                    return False
+            except Exception as e:
+                self.last_error = e
+                return False
+        return self.refresh()
+
+    def refresh_async(self, target=None):
+        # 이미 새로고침 중이면 중복 실행하지 않습니다.
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=target or self.refresh, name="kb-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def maybe_reconcile(self):
+        # rerun마다 호출해도 되도록 시간만 비교하고, 확인 작업은 백그라운드에서 합니다.
+        # 공유 파일이 바뀌었는지는 stat 한 번이면 되므로 rerun마다 확인해 바로 다시 엽니다.
+        if self._kb_file_changed():
+            self._open_kb_file()
+        if time.time() - self._last_checked >= self.reconcile_interval:
+            self._last_checked = time.time()
+            self.refresh_async(target=self.reconcile)
+
+    def apply_new_row(self, question_cell, answer_cell, image_url_cell):
+        with self._lock:
+            current = self.current
+            if current.kb is None:
+                return False
+            self.current = current._replace(
+                generation=current.generation + 1,
+                kb=append_row_to_knowledge_base(current.kb, question_cell, answer_cell, image_url_cell),
+            )
+        return True
+
+    @property
+    def refreshing(self):
+        return self._refresh_thread is not None and self._refresh_thread.is_alive()
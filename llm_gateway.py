@@ -0,0 +1,175 @@
+# Perplexity(OpenAI 호환 API) 호출용 프로세스 공용 게이트웨이
+# rerun마다 OpenAI 클라이언트를 새로 만들면 연결 풀도 새로 생겨 매 턴 TCP/TLS 연결을 다시 맺고, 시간 제한도 없었습니다.
+# 프로세스에 하나만 만들어(st.cache_resource) keep-alive 연결 풀을 모든 세션이 함께 쓰고,
+# 연결/첫 토큰/전체 시간 제한과 연결 오류에 한정한 재시도(지터 백오프)를 여기서 한 번에 처리합니다.
+#
+# 시간 제한
+#   connect_timeout: TCP/TLS 연결
+#   first_token_timeout: 응답을 기다리는 읽기 제한 (첫 토큰까지, 그리고 스트림 중간에 멈춘 경우)
+#   total_timeout: 요청부터 스트림 끝까지 - 넘으면 스트림을 닫고 LLMStreamTimeout을 발생시킵니다.
+# 재시도는 스트림을 열 때의 연결 실패(연결 거부, 연결 시간 초과)만 합니다. 요청이 서버에 전달된 뒤의
+# 읽기 시간 초과나 4xx/5xx는 같은 요청을 다시 보내도 빨라지지 않으므로 바로 실패시킵니다.
+import random
+import threading
+import time
+
+import openai
+from openai import OpenAI
+
+try:
+    import httpx2 as httpx # openai 3.x는 httpx2 패키지를 사용합니다.
+except ImportError:
+    import httpx
+
+
+class LLMStreamTimeout(Exception):
+    pass
+
+
+class _DrainAfterDoneStream(httpx.SyncByteStream):
+    # openai의 동기 스트림은 [DONE]을 받으면 남은 본문(HTTP/1.1 chunked 종료 표시)을 읽지 않고 응답을 닫아서
+    # 연결이 풀로 돌아가지 못하고 매번 새로 맺어집니다. [DONE]까지 받은 응답은 닫기 전에 남은 본문을 마저 읽습니다.
+    # (중간에 취소된 스트림은 남은 답변을 기다리지 않도록 그대로 닫습니다.)
+    def __init__(self, stream):
+        self._stream = stream
+        self._iterator = None
+        self._tail = b""
+
+    def __iter__(self):
+        self._iterator = iter(self._stream)
+        for chunk in self._iterator:
+            self._tail = (self._tail + chunk)[-64:]
+            yield chunk
+
+    def close(self):
+        try:
+            if self._iterator is not None and b"[DONE]" in self._tail:
+                for _ in self._iterator:
+                    pass
+        finally:
+            self._stream.close()
+
+
+class _TracingTransport(httpx.HTTPTransport):
+    # 요청마다 httpcore trace 콜백을 붙여 새 연결/TLS 핸드셰이크 수를 셉니다.
+    def __init__(self, on_trace, **kwargs):
+        super().__init__(**kwargs)
+        self._on_trace = on_trace
+
+    def handle_request(self, request):
+        request.extensions = {**request.extensions, "trace": self._on_trace}
+        response = super().handle_request(request)
+        response.stream = _DrainAfterDoneStream(response.stream)
+        return response
+
+    @property
+    def connections(self):
+        return self._pool.connections
+
+
+class _DeadlineStream:
+    # 청크 스트림을 감싸 전체 시간 제한을 넘으면 연결을 닫고 LLMStreamTimeout을 발생시킵니다.
+    def __init__(self, stream, deadline, on_timeout):
+        self._stream = stream
+        self._deadline = deadline
+        self._on_timeout = on_timeout
+
+    def __iter__(self):
+        for chunk in self._stream:
+            if time.monotonic() > self._deadline:
+                self.close()
+                self._on_timeout()
+                raise LLMStreamTimeout("LLM 응답이 전체 시간 제한을 넘었습니다.")
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+def is_connection_failure(error):
+    # 요청이 서버에 닿기 전에 실패한 경우만 True (APITimeoutError는 연결 시간 초과일 때만)
+    if isinstance(error, openai.APITimeoutError):
+        return isinstance(error.__cause__, httpx.ConnectTimeout)
+    return isinstance(error, openai.APIConnectionError)
+
+
+class LLMGateway:
+    def __init__(self, api_key, base_url, max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0,
+                 connect_timeout=3.0, first_token_timeout=10.0, total_timeout=60.0,
+                 max_retries=2, backoff_base=0.2, backoff_cap=2.0):
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.counters = {
+            "requests": 0, # 실제로 보낸 요청 수 (재시도 포함)
+            "retries": 0,
+            "connection_errors": 0,
+            "timeouts": 0, # 전체 시간 제한 초과
+            "connections_opened": 0, # 새 TCP 연결 수 (keep-alive로 재사용되면 늘지 않음)
+            "tls_handshakes": 0,
+        }
+        self.transport = _TracingTransport(
+            self._trace,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+        timeout = httpx.Timeout(first_token_timeout, connect=connect_timeout)
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0, # 재시도는 아래 _with_retries에서 연결 오류에만 합니다.
+            http_client=httpx.Client(transport=self.transport, timeout=timeout),
+        )
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self._count("connections_opened")
+        elif event_name == "connection.start_tls.complete":
+            self._count("tls_handshakes")
+
+    def _with_retries(self, request):
+        for attempt in range(self.max_retries + 1):
+            self._count("requests")
+            try:
+                return request()
+            except openai.APIConnectionError as e:
+                if not is_connection_failure(e):
+                    raise
+                self._count("connection_errors")
+                if attempt == self.max_retries:
+                    raise
+            self._count("retries")
+            # full jitter: 0 ~ min(cap, base * 2^attempt) 사이에서 무작위로 기다립니다.
+            time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+
+    def open_chat_stream(self, model, messages):
+        # 스트리밍 요청을 열고 청크 스트림(전체 시간 제한 적용)을 반환합니다.
+        deadline = time.monotonic() + self.total_timeout
+        stream = self._with_retries(
+            lambda: self.client.chat.completions.create(model=model, messages=messages, stream=True)
+        )
+        return _DeadlineStream(stream, deadline, on_timeout=lambda: self._count("timeouts"))
+
+    def stats(self):
+        # 카운터 + 현재 연결 풀 상태 (열린 연결 수, 그중 쉬고 있는 연결 수)
+        connections = list(self.transport.connections)
+        with self._lock:
+            stats = dict(self.counters)
+        stats["pool_connections"] = len(connections)
+        stats["pool_idle"] = sum(1 for c in connections if c.is_idle())
+        stats["pool_max"] = self.max_connections
+        return stats
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,122 @@
+# 질문 매칭용 인덱스
+# load_google_sheet_data()가 반환될 때 한 번만 만들어 두고,
+# 매 턴에는 미리 정규화해 둔 질문 목록에 대해 한 번의 벡터화된 점수 계산만 수행합니다.
+import copy
+import re
+import unicodedata
+
+import numpy as np
+from rapidfuzz import process, fuzz
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def split_hangul_jamo(text):
+    # 한글 음절을 초성/중성/종성 자모로 분해합니다. (예: "세팅" -> "세팅")
+    # 받침 하나 차이 같은 오타에도 점수가 덜 깎이도록 할 때 사용합니다.
+    return unicodedata.normalize("NFD", text)
+
+
+def normalize_text(text, use_jamo=False, canonicalizer=None):
+    # 공백을 하나로 접고 대소문자를 통일합니다. ("TUC  세팅" == "tuc 세팅")
+    normalized = _WHITESPACE_RE.sub(" ", str(text)).strip().casefold()
+    if canonicalizer is not None:
+        # 동의어를 대표어로 치환합니다. (synonyms.SynonymCanonicalizer)
+        normalized = canonicalizer.canonicalize(normalized)
+    if use_jamo:
+        normalized = split_hangul_jamo(normalized)
+    return normalized
+
+
+class MatchIndex:
+    def __init__(self, questions, use_jamo=False, canonicalizer=None):
+        self.questions = list(questions)
+        self.use_jamo = use_jamo
+        self.canonicalizer = canonicalizer
+        # 질문 문자열은 로딩 시점에 한 번만 정규화합니다.
+        self.normalized_questions = [self.normalize(q) for q in self.questions]
+
+    def __len__(self):
+        return len(self.questions)
+
+    def extended(self, new_questions):
+        # 기존 정규화 결과는 그대로 두고 새 질문만 정규화해 덧붙인 새 인덱스를 반환합니다.
+        # (다른 세션이 읽고 있는 기존 인덱스는 바뀌지 않습니다.)
+        new_questions = list(new_questions)
+        extended = copy.copy(self)
+        extended.questions = self.questions + new_questions
+        extended.normalized_questions = self.normalized_questions + [self.normalize(q) for q in new_questions]
+        return extended
+
+    def normalize(self, text):
+        return normalize_text(text, use_jamo=self.use_jamo, canonicalizer=self.canonicalizer)
+
+    def score(self, user_input):
+        # 전체 질문 목록에 대한 fuzz.ratio 점수를 한 번의 cdist 호출로 계산합니다.
+        return process.cdist(
+            [self.normalize(user_input)],
+            self.normalized_questions,
+            scorer=fuzz.ratio,
+            dtype=np.float64,
+        )[0]
+
+    def score_many(self, user_inputs, workers=1):
+        # 여러 질의를 한 번의 cdist 행렬 계산으로 처리하고,
+        # 질문(열)마다 가장 높은 점수만 남깁니다. workers=-1이면 모든 코어를 사용합니다.
+        queries = list(dict.fromkeys(self.normalize(q) for q in user_inputs))
+        scores = process.cdist(
+            queries,
+            self.normalized_questions,
+            scorer=fuzz.ratio,
+            dtype=np.float64,
+            workers=workers,
+        )
+        return scores.max(axis=0)
+
+    def search(self, user_input, limit=5):
+        # 점수가 높은 순서로 (질문, 점수, 인덱스) 후보를 최대 limit개 반환합니다.
+        if not self.questions or limit <= 0:
+            return []
+        return self._top_k(self.score(user_input), limit)
+
+    def search_many(self, user_inputs, limit=5, workers=1):
+        if not self.questions or not user_inputs or limit <= 0:
+            return []
+        return self._top_k(self.score_many(user_inputs, workers=workers), limit)
+
+    def _top_k(self, scores, limit):
+        limit = min(limit, len(scores))
+        if limit < len(scores):
+            # limit번째 점수 이상인 질문만 후보로 남깁니다. (경계 동점은 모두 포함)
+            kth_score = -np.partition(-scores, limit - 1)[limit - 1]
+            candidate_idx = np.flatnonzero(scores >= kth_score)
+        else:
+            candidate_idx = np.arange(len(scores))
+        # 동점이면 extractOne과 같이 앞쪽(인덱스가 작은) 질문이 먼저 오도록 정렬합니다.
+        order = np.lexsort((candidate_idx, -scores[candidate_idx]))
+        return [
+            (self.questions[i], float(scores[i]), int(i))
+            for i in candidate_idx[order][:limit]
+        ]
+
+
+# RapidFuzz로 유사도 기반 질문 매칭 함수 (임계값 60~70)
+def find_best_match(user_input, match_index, threshold=65):
+    if match_index is None or len(match_index) == 0:
+        return None, 0, -1
+    candidates = match_index.search(user_input, limit=1)
+    best_question, best_score, best_idx = candidates[0]
+    if best_score >= threshold:
+        return best_question, best_score, best_idx
+    return None, best_score, best_idx
+
+
+# 여러 질의 중 가장 높은 점수의 질문을 고릅니다. (동점이면 앞쪽 질문)
+def find_best_match_many(user_inputs, match_index, threshold=65, workers=1):
+    if match_index is None or len(match_index) == 0 or not user_inputs:
+        return None, 0, -1
+    candidates = match_index.search_many(user_inputs, limit=1, workers=workers)
+    best_question, best_score, best_idx = candidates[0]
+    if best_score >= threshold:
+        return best_question, best_score, best_idx
+    return None, best_score, best_idx
@@ -0,0 +1,114 @@
+# 턴(질문 1회)별 지연 시간/토큰 지표
+# 단계별 시간(정규화, 매칭, 정보 압축, LLM 요청, 첫 토큰, 스트리밍)과 매칭 점수/행, 입력/출력 크기, 캐시 적중 여부를
+# 회전(rotating) JSONL 파일에 한 줄씩 남기고, 최근 기록으로 p50/p95를 계산합니다.
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+TIMING_FIELDS = ("canonicalize", "match", "pack_context", "llm_request", "ttft", "stream", "total")
+
+
+class TurnMetrics:
+    def __init__(self, **fields):
+        self.started_at = time.perf_counter()
+        self.timings = {} # 단계 이름 -> 초
+        self.fields = {"timestamp": time.time(), **fields}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def finish(self):
+        self.timings["total"] = time.perf_counter() - self.started_at
+        return {**self.fields, "timings": self.timings}
+
+
+class MetricsRecorder:
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backup_count=3, window=1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.recent = deque(maxlen=window) # p50/p95 계산용 최근 기록
+        self.counters = {"turns": 0, "cache_hits": 0, "cache_misses": 0, "matched": 0, "summary_hits": 0, "coalesced": 0, "prompt_tokens": 0,
+                         "llm_path_primary": 0, "llm_path_primary_late": 0, "llm_path_hedge": 0, "llm_path_sheet": 0,
+                         "llm_path_partial": 0}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _rotate(self):
+        # turns.jsonl -> turns.jsonl.1 -> ... -> turns.jsonl.{backup_count}
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def record(self, turn):
+        record = turn.finish() if isinstance(turn, TurnMetrics) else turn
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.recent.append(record)
+            self.counters["turns"] += 1
+            if record.get("cache_hit") is True:
+                self.counters["cache_hits"] += 1
+            elif record.get("cache_hit") is False:
+                self.counters["cache_misses"] += 1
+            if record.get("matched_row") is not None:
+                self.counters["matched"] += 1
+            if record.get("summary_hit"):
+                self.counters["summary_hits"] += 1
+            if record.get("coalesced"):
+                self.counters["coalesced"] += 1 # 진행 중인 같은 요청에 합쳐져 LLM을 따로 부르지 않은 턴
+            if record.get("llm_path"):
+                # 답변 경로: primary(목표 안에 첫 토큰), primary_late(목표를 넘겼지만 먼저 도착),
+                # hedge(빠른 모델이 이김), sheet(모두 실패해 시트 원문으로 끝남), partial(스트림이 중간에 실패해 받은 부분만 남김)
+                self.counters[f"llm_path_{record['llm_path']}"] += 1
+            self.counters["prompt_tokens"] += record.get("prompt_tokens") or 0 # usage로 받은 실제 입력 토큰 수
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line.encode("utf-8")) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        return record
+
+    def summary(self):
+        # 단계별 {count, p50, p95} (초)
+        with self._lock:
+            records = list(self.recent)
+        summary = {}
+        for name in TIMING_FIELDS:
+            values = [r["timings"][name] for r in records if r.get("timings", {}).get(name) is not None]
+            if values:
+                p50, p95 = np.percentile(values, [50, 95])
+                summary[name] = {"count": len(values), "p50": float(p50), "p95": float(p95)}
+        return summary
+
+    def prometheus_text(self):
+        # Prometheus 텍스트 형식 (summary 타입 + 카운터)
+        lines = [
+            "# HELP ori_turn_phase_seconds Per-turn phase latency over the recent window.",
+            "# TYPE ori_turn_phase_seconds summary",
+        ]
+        for name, stats in self.summary().items():
+            lines.append(f'ori_turn_phase_seconds{{phase="{name}",quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'ori_turn_phase_seconds{{phase="{name}",quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'ori_turn_phase_seconds_count{{phase="{name}"}} {stats["count"]}')
+        with self._lock:
+            counters = dict(self.counters)
+        for name, value in counters.items():
+            lines.append(f"# TYPE ori_{name}_total counter")
+            lines.append(f"ori_{name}_total {value}")
+        return "\n".join(lines) + "\n"
@@ -1,15 +1,26 @@
 # pip install openai gspread google-auth rapidfuzz
 import base64
-from openai import OpenAI
 import streamlit as st
-import pandas as pd
-import gspread
-from google.oauth2 import service_account
 import json
 import os
 import re
-from rapidfuzz import process, fuzz
+import time
+import uuid
 from datetime import datetime
+from answer_cache import AnswerCache
+from chat_store import ChatStore
+from context_packer import find_runner_ups, pack_context
+from fake_sheets import FakeSpreadsheet
+from image_variants import THUMBNAIL_WIDTH, ImageVariants
+from knowledge_base import INPUT_SHEET_NAME, KnowledgeBaseStore, fetch_sheet_values, resolve_row
+from llm_gateway import LLMGateway
+from match_index import find_best_match
+from metrics import MetricsRecorder, TurnMetrics
+from sheets_gateway import SheetsGateway
+from singleflight import SingleFlight, first_to_respond
+from streaming import render_text_stream
+from summaries import SummaryStore
+from write_queue import STATUS_FAILED, STATUS_PENDING, SheetWriteQueue
 
 # --- 시스템 메시지 정의 (초기화에 사용되므로 먼저 정의) ---
 system_message_content = """
@@ -28,9 +39,9 @@ if "login" not in st.session_state:
 if "perplexity_model" not in st.session_state:
     st.session_state["perplexity_model"] = "sonar-pro"
 
-# 채팅 기록 관련 세션 상태 변수 초기화
-if "chat_logs" not in st.session_state:
-    st.session_state["chat_logs"] = {} # 모든 채팅 기록을 저장할 딕셔너리
+# 채팅 기록 관련 세션 상태 변수 초기화 (기록 자체는 chat_store.ChatStore에 저장)
+if "chat_log_page" not in st.session_state:
+    st.session_state["chat_log_page"] = 0 # 사이드바 채팅 기록 목록의 현재 페이지
 
 if "current_chat_id" not in st.session_state:
     st.session_state["current_chat_id"] = None # 현재 보고 있는 채팅의 ID
@@ -44,31 +55,10 @@ if "messages" not in st.session_state:
 if "show_guidelines" not in st.session_state:
     st.session_state.show_guidelines = True
 
-# --- 동의어 사전 정의 ---
-SYNONYM_MAP = {
-    "수술 준비": ["수술 세팅", "수술준비", "수술세팅", "세팅", "준비"],
-    "장비": ["기구", "물품"],
-    "방법": ["과정", "절차"],
-    "TUC": ["Tuc","tuc", "경요도", "요도절제술"],
-    "사용하는": ["필요한", "필요한 장비", "필요한 물품", "필요한 기구", "필요한 것", "사용하는 장비"]
-}
-
-# --- 쿼리 확장 함수 ---
-def expand_query_with_synonyms(query):
-    expanded_queries = [query]
-    for main_term, synonyms in SYNONYM_MAP.items():
-        if main_term in query:
-            for syn in synonyms:
-                if syn not in query:
-                    expanded_queries.append(query.replace(main_term, syn))
-        for syn in synonyms:
-            if syn in query:
-                if main_term not in query:
-                    expanded_queries.append(query.replace(syn, main_term))
-                for other_syn in [s for s in synonyms if s != syn]:
-                    if other_syn not in query:
-                        expanded_queries.append(query.replace(syn, other_syn))
-    return list(set(expanded_queries))
+# 대화 기록 출력 창 크기 (최근 몇 개의 메시지를 출력할지)
+HISTORY_PAGE_SIZE = 20
+if "history_window" not in st.session_state:
+    st.session_state.history_window = HISTORY_PAGE_SIZE
 
 # --- 이미지 Base64 인코딩 함수 (중복 코드를 줄이기 위해) ---
 @st.cache_data
@@ -105,6 +95,7 @@ def login():
     if st.button("로그인"):
         if user_id == "ori" and user_pw == "0":
             st.session_state["login"] = True
+            st.session_state["user_id"] = user_id
             st.success("로그인 성공!")
             st.rerun()
         else:
@@ -149,104 +140,117 @@ if st.session_state.show_guidelines and len(st.session_state.messages) == 1:
     st.warning("⚠️ **ORi는 참고용 정보입니다.** 실제 업무 시 병원 프로토콜을 우선 따르세요!")
     st.markdown("---")
 
-@st.cache_data
+SHEET_URL = "https://docs.google.com/spreadsheets/d/11DUuktRmn1UlchUbeytQAsxC9RaHmL-PW-6480vXYSo/edit?gid=0#gid=0"
+DATA_DIR = os.environ.get("ORI_DATA_DIR", "data") # 부하 테스트 등에서는 별도 폴더를 지정해 실제 데이터와 분리
+KB_SNAPSHOT_PATH = os.path.join(DATA_DIR, "kb_snapshot.sqlite3")
+KB_FILE_PATH = os.path.join(DATA_DIR, "kb_index.bin") # 같은 서버의 프로세스들이 함께 여는 지식 베이스 파일 (kb_mmap.py)
+WRITE_QUEUE_PATH = os.path.join(DATA_DIR, "sheet_write_queue.sqlite3")
+CHAT_STORE_PATH = os.path.join(DATA_DIR, "chat_logs.sqlite3")
+METRICS_PATH = os.path.join(DATA_DIR, "metrics", "turns.jsonl")
+IMAGE_VARIANT_DIR = os.path.join(DATA_DIR, "image_variants")
+
+# 프로세스에 하나뿐인 구글 시트 게이트웨이 (인증 세션, 커넥션 풀, 시트 핸들 재사용)
+@st.cache_resource
+def get_sheets_gateway():
+    fixture_path = os.environ.get("ORI_SHEET_FIXTURE")
+    if fixture_path:
+        # 구글 API 없이 로컬 JSON 픽스처로 실행 (개발/테스트용)
+        return FakeSpreadsheet.from_json(fixture_path)
+    json_key_info = json.loads(st.secrets["GOOGLE_SERVICE_ACCOUNT_KEY"])
+    sheet_id = SHEET_URL.split('/d/')[1].split('/')[0]
+    return SheetsGateway(json_key_info, sheet_id)
+
+# 프로세스에 하나뿐인 지식 베이스 보관소
+# 공유 지식 베이스 파일(또는 로컬 스냅샷)로 바로 시작하고, 구글 시트는 백그라운드 스레드에서 다시 읽어 교체합니다.
+@st.cache_resource
+def get_knowledge_base_store():
+    gateway = get_sheets_gateway()
+    return KnowledgeBaseStore(
+        lambda: gateway.run(fetch_sheet_values),
+        KB_SNAPSHOT_PATH,
+        fetch_version=getattr(gateway, "get_lastUpdateTime", None), # 로컬 픽스처는 수정 시각이 없음
+        kb_file_path=KB_FILE_PATH,
+    ).start()
+
+# '정보 저장' 제출을 로컬 저널에 기록하고 백그라운드에서 구글 시트에 모아 쓰는 대기열
+@st.cache_resource
+def get_sheet_write_queue():
+    return SheetWriteQueue(WRITE_QUEUE_PATH, get_sheets_gateway()).start()
+
 def load_google_sheet_data():
-    try:
+    if not os.environ.get("ORI_SHEET_FIXTURE"):
         # 1. secrets에 GOOGLE_SERVICE_ACCOUNT_KEY가 있는지 확인
         if "GOOGLE_SERVICE_ACCOUNT_KEY" not in st.secrets:
             st.error("❌ GOOGLE_SERVICE_ACCOUNT_KEY가 Streamlit Secrets에 설정되지 않았습니다.")
             st.info("📝 Streamlit Cloud 앱 설정에서 Advanced settings > Secrets에 Google 서비스 계정 키(JSON 내용)를 추가해주세요.")
             return None
 
-        # 2. secrets에서 JSON 문자열을 가져와 파싱
-        # service_key.json의 내용을 문자열로 직접 사용
-        json_key_info = json.loads(st.secrets["GOOGLE_SERVICE_ACCOUNT_KEY"])
-
-        # 3. service_account.Credentials.from_service_account_info 사용
-        credentials = service_account.Credentials.from_service_account_info(
-            json_key_info,
-            scopes=['https://www.googleapis.com/auth/spreadsheets',
-                    'https://www.googleapis.com/auth/drive']
-        )
-        gc = gspread.authorize(credentials)
-        sheet_url = "https://docs.google.com/spreadsheets/d/11DUuktRmn1UlchUbeytQAsxC9RaHmL-PW-6480vXYSo/edit?gid=0#gid=0"
-        sheet_id = sheet_url.split('/d/')[1].split('/')[0]
-        sh = gc.open_by_key(sheet_id)
-        
-        # --- 기존 Sheet1 로드 ---
-        worksheet_main = sh.worksheet('Sheet1') # 기존 'Sheet1'
-        data_main = worksheet_main.get_all_values()
-        df_main = pd.DataFrame(data_main[1:], columns=data_main[0])
-        
-        # --- 새로운 Data_Input 시트 로드 ---
-        df_input_full = pd.DataFrame() # Data_Input 전체 데이터를 담을 변수 초기화
+        # 2. secrets의 JSON 문자열 형식 확인 (service_key.json의 내용을 문자열로 직접 사용)
         try:
-            worksheet_input = sh.worksheet('Data_Input') # 새롭게 추가한 'Data_Input' 시트
-            data_input = worksheet_input.get_all_values()
-            if data_input: # 데이터가 있을 경우에만 DataFrame 생성
-                df_input_full = pd.DataFrame(data_input[1:], columns=data_input[0])
-            else:
-                st.info("ℹ️ 'Data_Input' 시트에 데이터가 없습니다. 새로운 정보를 입력해주세요.")
-            
-            # --- 여기에서 '질문', '답변', 'Image URL' 컬럼을 합치는 로직은 그대로 유지 ---
-            cols_to_use = ['질문', '답변', 'Image URL']
-            df_main_filtered = df_main[cols_to_use] if all(col in df_main.columns for col in cols_to_use) else pd.DataFrame(columns=cols_to_use)
-            df_input_filtered = df_input_full[cols_to_use] if all(col in df_input_full.columns for col in cols_to_use) else pd.DataFrame(columns=cols_to_use)
-
-            combined_df = pd.concat([df_main_filtered, df_input_filtered], ignore_index=True)
-
-        except gspread.exceptions.WorksheetNotFound:
-            st.warning("⚠️ 'Data_Input' 시트를 찾을 수 없습니다. 새로운 정보를 저장하려면 시트를 생성해주세요.")
-            combined_df = df_main # Data_Input이 없으면 기존 Sheet1만 사용
-
-        if len(combined_df) < 1 or combined_df.empty:
-            st.warning("구글 시트에 유효한 데이터가 없습니다. 시트에 '질문', '답변', 'Image URL' 컬럼을 포함해 데이터를 입력해 주세요.")
+            json.loads(st.secrets["GOOGLE_SERVICE_ACCOUNT_KEY"])
+        except json.JSONDecodeError:
+            st.error("❌ Streamlit Secrets의 GOOGLE_SERVICE_ACCOUNT_KEY 내용이 올바른 JSON 형식이 아닙니다.")
+            st.info("📝 service_key.json 파일의 전체 내용을 큰따옴표 안에 정확히 복사했는지 확인해주세요.")
             return None
 
-        questions = []
-        answers = []
-        image_urls = []
-
-        for index, row in combined_df.iterrows():
-            question_cell = str(row.get('질문', ''))
-            answer_cell = row.get('답변', '')
-            image_url_cell = row.get('Image URL', '')
-
-            for q in question_cell.split(','):
-                q_stripped = q.strip()
-                if q_stripped:
-                    questions.append(q_stripped)
-                    answers.append(answer_cell)
-                    image_urls.append(image_url_cell)
-        
-        return {
-            'questions': questions,
-            'answers': answers,
-            'image_urls': image_urls,
-            'full_data_input': df_input_full # 'Data_Input' 시트의 전체 데이터프레임을 반환
-        }
-
-
-    except json.JSONDecodeError:
-        st.error("❌ Streamlit Secrets의 GOOGLE_SERVICE_ACCOUNT_KEY 내용이 올바른 JSON 형식이 아닙니다.")
-        st.info("📝 service_key.json 파일의 전체 내용을 큰따옴표 안에 정확히 복사했는지 확인해주세요.")
-        return None
-    except Exception as e:
-        st.error(f"❌ 구글 시트 연결 또는 인증 오류: {type(e).__name__} - {str(e)}")
-        st.info("📝 1. 구글 서비스 계정 이메일 주소가 구글 시트와 공유되어 있는지 확인해주세요.\n"
-                "📝 2. Streamlit Secrets에 입력된 GOOGLE_SERVICE_ACCOUNT_KEY의 내용이 정확한지 확인해주세요.")
+    store = get_knowledge_base_store()
+    store.maybe_reconcile() # 시트에서 직접 수정된 내용은 주기적으로 확인해 반영
+    handle = store.current # rerun 동안 같은 버전을 참조 (복사하지 않음)
+    kb = handle.kb
+    e = store.last_error
+    if kb is None:
+        if e is not None:
+            st.error(f"❌ 구글 시트 연결 또는 인증 오류: {type(e).__name__} - {str(e)}")
+            st.info("📝 1. 구글 서비스 계정 이메일 주소가 구글 시트와 공유되어 있는지 확인해주세요.\n"
+                    "📝 2. Streamlit Secrets에 입력된 GOOGLE_SERVICE_ACCOUNT_KEY의 내용이 정확한지 확인해주세요.")
+        store.refresh_async() # 다음 rerun을 위해 백그라운드에서 다시 시도
         return None
 
+    if e is not None and handle.source == 'snapshot':
+        st.warning(f"⚠️ 구글 시트에 연결하지 못해 저장된 데이터({datetime.fromtimestamp(handle.loaded_at).strftime('%Y-%m-%d %H:%M')})로 답변합니다.")
+    for level, message in kb['notices']:
+        getattr(st, level)(message)
+    return kb
+
 sheet_data_loaded = load_google_sheet_data()
 
 questions = []
-answers = []
-image_urls = []
+match_index = None
+
+# 같은 질문에 대한 Perplexity 답변을 세션/사용자 간에 재사용하기 위한 캐시
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(max_entries=512, ttl_seconds=6 * 60 * 60)
+
+answer_cache = get_answer_cache()
+
+# 캐시에 들어가기 전 동시에 들어온 같은 요청을 하나의 스트리밍 요청으로 합칩니다.
+@st.cache_resource
+def get_single_flight():
+    return SingleFlight()
+
+# 채팅 이미지: 축소된 WebP를 기본으로 보내고, 원본은 '원본 보기'를 켰을 때만 보냅니다.
+@st.cache_resource
+def get_image_variants():
+    return ImageVariants("images", IMAGE_VARIANT_DIR)
+
+def render_chat_image(image_file_name, key):
+    image_variants = get_image_variants()
+    if not image_variants.exists(image_file_name):
+        st.warning(f"이미지 파일을 찾을 수 없습니다: {image_file_name}")
+        return
+    show_original = st.toggle("원본 보기", key=key)
+    try:
+        image_bytes = image_variants.get(image_file_name, width=None if show_original else THUMBNAIL_WIDTH)
+    except Exception:
+        image_bytes = image_variants.get(image_file_name, width=None) # 변환할 수 없는 이미지는 원본 표시
+    st.image(image_bytes, caption="수술방 장비 세팅 예시", use_container_width=True)
 
 if sheet_data_loaded is not None:
     questions = sheet_data_loaded['questions']
-    answers = sheet_data_loaded['answers']
-    image_urls = sheet_data_loaded['image_urls']
+    match_index = sheet_data_loaded['match_index']
+    # 내용이 바뀐 행의 캐시 답변은 버립니다.
+    answer_cache.sync_rows(sheet_data_loaded['kb_version'], sheet_data_loaded['row_hashes'])
     if not questions:
         st.info("ℹ️ 구글 시트에 등록된 질문이 없습니다. 시트에 질문/답변 데이터를 추가해 주세요.")
 else:
@@ -258,72 +262,84 @@ if "PERPLEXITY_API_KEY" not in st.secrets:
     st.info("📝 .streamlit/secrets.toml 파일에 API 키를 추가해주세요.")
     st.stop()
 
-client = OpenAI(
-    api_key=st.secrets["PERPLEXITY_API_KEY"],
-    base_url="https://api.perplexity.ai"
+# 프로세스에 하나뿐인 LLM 게이트웨이 (keep-alive 연결 풀, 시간 제한, 연결 오류 재시도)
+# 인자가 같으면 같은 게이트웨이를 돌려주므로 rerun마다 연결 풀을 새로 만들지 않습니다.
+@st.cache_resource
+def get_llm_gateway(api_key, base_url, first_token_timeout, total_timeout):
+    return LLMGateway(api_key, base_url, first_token_timeout=first_token_timeout, total_timeout=total_timeout)
+
+llm_gateway = get_llm_gateway(
+    st.secrets["PERPLEXITY_API_KEY"],
+    # 로컬 스텁 서버(benchmarks/stub_llm_server.py)로 부하 테스트할 때는 secrets에서 주소를 바꿉니다.
+    st.secrets.get("PERPLEXITY_BASE_URL", "https://api.perplexity.ai"),
+    float(st.secrets.get("LLM_FIRST_TOKEN_TIMEOUT", 10)), # 초
+    float(st.secrets.get("LLM_TOTAL_TIMEOUT", 60)), # 초
 )
 
-def find_best_match(user_input, questions, threshold=65):
-    if not questions:
-        return None, 0, -1
-    result = process.extractOne(user_input, questions, scorer=fuzz.ratio)
-    if result and result[1] >= threshold:
-        return result[0], result[1], result[2]
-    return None, result[1] if result else 0, result[2] if result else -1
-
-# 새 대화 시작 함수 (기존 로직 유지)
+# 미리 만든 행별 요약 (summaries.py로 생성, 지식 베이스 스냅샷과 같은 SQLite 파일에 저장)
+@st.cache_resource
+def get_summary_store():
+    return SummaryStore(KB_SNAPSHOT_PATH)
+
+summary_store = get_summary_store()
+# 매칭 점수가 이 이상이면 저장된 요약을 LLM 호출 없이 바로 보여줍니다. (낮추면 더 많은 질문이 빠른 경로를 탐)
+SUMMARY_SCORE_THRESHOLD = float(st.secrets.get("SUMMARY_SCORE_THRESHOLD", 90))
+
+# 채팅 기록 저장소 (프로세스 공용, SQLite WAL)
+@st.cache_resource
+def get_chat_store():
+    return ChatStore(CHAT_STORE_PATH)
+
+chat_store = get_chat_store()
+current_user = st.session_state.get("user_id", "ori")
+# 대화 기록의 주인. 지금은 모든 간호사가 같은 'ori' 계정으로 로그인하므로, 기본값은 예전 chat_logs처럼
+# 브라우저 세션 하나입니다. (계정 단위로 묶으면 서로의 대화를 보고 지울 수 있음)
+# 사용자마다 계정이 생기면 secrets의 CHAT_LOG_SCOPE = "user"로 계정 단위로 보관합니다. (다시 로그인해도 유지)
+if "chat_owner" not in st.session_state:
+    st.session_state["chat_owner"] = f"{current_user}:{uuid.uuid4().hex}"
+chat_owner = current_user if st.secrets.get("CHAT_LOG_SCOPE", "session") == "user" else st.session_state["chat_owner"]
+CHAT_LOG_PAGE_SIZE = 10
+# Perplexity에 보내는 정보(매칭된 답변)의 토큰 예산. 시트 셀이 아무리 길어도 턴당 입력 크기가 이 안으로 제한됩니다.
+CONTEXT_TOKEN_BUDGET = 800
+RUNNER_UP_SCORE_DELTA = 3 # 1순위와 점수 차이가 이 이내인 다른 행은 남은 예산으로 함께 보냄
+MAX_RUNNER_UPS = 1
+# 첫 토큰 지연 목표(초). 이 안에 첫 토큰이 오지 않으면 시트 원문(과 이미지)을 먼저 보여줍니다. 0이면 끔
+FIRST_TOKEN_SLO = float(st.secrets.get("FIRST_TOKEN_SLO", 3))
+# 목표를 넘겼을 때 같은 요청을 함께 보낼 빠른 모델 (secrets의 HEDGE_MODEL, 없으면 보내지 않음)
+if "hedge_model" not in st.session_state:
+    st.session_state["hedge_model"] = st.secrets.get("HEDGE_MODEL")
+SLO_FALLBACK_NOTE = "⏱️ 요약을 준비하는 동안 시트 원문을 먼저 보여드립니다."
+
+# 메시지를 현재 대화에 추가합니다. 저장소에는 메시지마다 한 번만 기록됩니다.
+def add_message(message):
+    st.session_state.messages.append(message)
+    chat_store.append_message(st.session_state.current_chat_id, message)
+
+# 새 대화 시작 함수 (메시지는 이미 저장소에 기록되어 있으므로 화면 상태만 초기화)
 def start_new_chat():
-    if len(st.session_state.messages) > 1:
-        if st.session_state.current_chat_id in st.session_state.chat_logs:
-            st.session_state.chat_logs[st.session_state.current_chat_id]["messages"] = st.session_state.messages[1:]
-        else:
-            if st.session_state.current_chat_id is None:
-                new_chat_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
-            else:
-                new_chat_id = st.session_state.current_chat_id
-            
-            first_user_message = next((m for m in st.session_state.messages if m["role"] == "user"), None)
-            log_title = first_user_message["content"] if first_user_message else "새 대화"
-            log_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            st.session_state.chat_logs[new_chat_id] = {
-                "title": log_title,
-                "datetime": log_datetime,
-                "messages": st.session_state.messages[1:]
-            }
-
     st.session_state.messages = [
         {"role": "system", "content": system_message_content}
     ]
     st.session_state.current_chat_id = None
     st.session_state.show_guidelines = True
+    st.session_state.history_window = HISTORY_PAGE_SIZE
     st.rerun()
 
-# 특정 채팅 로드 함수 (기존 로직 유지)
+# 특정 채팅 로드 함수 (대화를 열 때만 메시지를 읽습니다)
 def load_chat_log(chat_id):
-    if st.session_state.current_chat_id and st.session_state.current_chat_id != chat_id:
-        if len(st.session_state.messages) > 1:
-            if st.session_state.current_chat_id not in st.session_state.chat_logs:
-                first_user_message = next((m for m in st.session_state.messages if m["role"] == "user"), None)
-                log_title = first_user_message["content"] if first_user_message else "새 대화"
-                log_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                st.session_state.chat_logs[st.session_state.current_chat_id] = {
-                    "title": log_title,
-                    "datetime": log_datetime,
-                    "messages": st.session_state.messages[1:]
-                }
-            else:
-                st.session_state.chat_logs[st.session_state.current_chat_id]["messages"] = st.session_state.messages[1:]
-
-    loaded_log = st.session_state.chat_logs.get(chat_id)
-    if loaded_log:
-        st.session_state.messages = [
-            {"role": "system", "content": system_message_content}
-        ] + loaded_log["messages"]
-        st.session_state.current_chat_id = chat_id
-        st.session_state.show_guidelines = False
+    st.session_state.messages = [
+        {"role": "system", "content": system_message_content}
+    ] + chat_store.load_messages(chat_owner, chat_id)
+    st.session_state.current_chat_id = chat_id
+    st.session_state.show_guidelines = False
+    st.session_state.history_window = HISTORY_PAGE_SIZE
     st.rerun()
 
+# 턴별 지연 시간 지표 (프로세스 공용, data/metrics/turns.jsonl)
+@st.cache_resource
+def get_metrics_recorder():
+    return MetricsRecorder(METRICS_PATH)
+
 # --- [사이드바 구현] ---
 with st.sidebar:
     st.header("나의 채팅 기록")
@@ -371,20 +387,13 @@ with st.sidebar:
                 with open(os.path.join("images", image_filename), "wb") as f:
                     f.write(uploaded_file.getbuffer())
                 st.success(f"이미지 '{image_filename}'가 로컬 'images' 폴더에 저장되었습니다. 💾")
+                try:
+                    get_image_variants().generate(image_filename) # 채팅용 축소 이미지를 미리 생성
+                except Exception as e:
+                    st.warning(f"축소 이미지 생성 중 오류가 발생했습니다. 원본 이미지로 표시됩니다: {e}")
             
-            # 2. Google Sheets에 데이터 추가
+            # 2. Google Sheets 쓰기 대기열에 추가 (실제 쓰기는 백그라운드 작업자가 모아서 처리)
             try:
-                json_key_info = json.loads(st.secrets["GOOGLE_SERVICE_ACCOUNT_KEY"])
-                credentials = service_account.Credentials.from_service_account_info(
-                    json_key_info,
-                    scopes=['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-                )
-                gc = gspread.authorize(credentials)
-                sheet_url = "https://docs.google.com/spreadsheets/d/11DUuktRmn1UlchUbeytQAsxC9RaHmL-PW-6480vXYSo/edit?gid=0#gid=0"
-                sheet_id = sheet_url.split('/d/')[1].split('/')[0]
-                sh = gc.open_by_key(sheet_id)
-                input_worksheet = sh.worksheet('Data_Input') # 'Data_Input' 탭 선택
-
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
                 # --- 이 부분이 수정됩니다: new_row 순서 및 컬럼 매칭 ---
@@ -401,29 +410,46 @@ with st.sidebar:
                 ]
                 # --- 수정 끝 ---
 
-                input_worksheet.append_row(new_row)
-                st.success("새로운 정보가 성공적으로 저장되었습니다! ✅")
+                get_sheet_write_queue().enqueue(INPUT_SHEET_NAME, new_row)
+                st.success("새로운 정보가 저장 대기열에 추가되었습니다! ⏳ 잠시 후 구글 시트에 반영됩니다.")
                 
-                load_google_sheet_data.clear()
+                # 시트 전체를 다시 읽지 않고 방금 추가한 행만 지식 베이스와 매칭 인덱스에 붙입니다.
+                get_knowledge_base_store().apply_new_row(input_question, input_answer, image_filename if image_filename else "")
                 
             except Exception as e:
                 st.error(f"정보 저장 중 오류 발생: {e}")
                 st.warning("Google Sheet 권한, 탭 이름, 컬럼 이름이 정확한지 확인해주세요.")
 
+    # 구글 시트 쓰기 대기열 상태 (시트 설정이 정상일 때만 표시)
+    if sheet_data_loaded is not None:
+        write_queue_counts = get_sheet_write_queue().counts()
+        if write_queue_counts[STATUS_PENDING]:
+            st.caption(f"⏳ 구글 시트 저장 대기 중: {write_queue_counts[STATUS_PENDING]}건")
+        if write_queue_counts[STATUS_FAILED]:
+            with st.expander(f"❌ 구글 시트 저장 실패: {write_queue_counts[STATUS_FAILED]}건"):
+                for failed in get_sheet_write_queue().failed_rows():
+                    st.markdown(f"**{failed['row'][0]}** ({failed['attempts']}회 시도)")
+                    st.caption(failed['last_error'])
+                if st.button("다시 시도", key="retry_failed_writes"):
+                    get_sheet_write_queue().retry_failed()
+                    st.rerun()
+
     st.markdown("---")
 
-    if st.session_state.chat_logs:
-        sorted_chat_logs = sorted(
-            st.session_state.chat_logs.items(),
-            key=lambda item: datetime.strptime(item[1]["datetime"], "%Y-%m-%d %H:%M:%S"),
-            reverse=True
-        )
+    # 제목과 시각만 페이지 단위로 읽어옵니다.
+    chat_log_count = chat_store.count_chats(chat_owner)
+    page_count = max(1, -(-chat_log_count // CHAT_LOG_PAGE_SIZE))
+    st.session_state.chat_log_page = min(st.session_state.chat_log_page, page_count - 1)
+    chat_log_page = chat_store.list_chats(
+        chat_owner, limit=CHAT_LOG_PAGE_SIZE, offset=st.session_state.chat_log_page * CHAT_LOG_PAGE_SIZE
+    )
 
-        for chat_id, log_data in sorted_chat_logs:
+    if chat_log_page:
+        for chat_id, log_title, log_datetime in chat_log_page:
             col1_log, col2_log = st.columns([0.8, 0.2])
             with col1_log:
-                formatted_datetime = datetime.strptime(log_data['datetime'], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d\n%H:%M")
-                button_label = f"{log_data['title']}\n{formatted_datetime}"
+                formatted_datetime = f"{log_datetime[:10]}\n{log_datetime[11:16]}" # 'YYYY-MM-DD HH:MM:SS'
+                button_label = f"{log_title}\n{formatted_datetime}"
                 
                 if st.button(
                     button_label, 
@@ -435,53 +461,84 @@ with st.sidebar:
 
             with col2_log:
                 if st.button("🗑️", key=f"delete_{chat_id}", help="이 대화 기록을 삭제합니다."):
-                    del st.session_state.chat_logs[chat_id]
+                    chat_store.delete_chat(chat_owner, chat_id)
                     if st.session_state.current_chat_id == chat_id:
                         start_new_chat()
                     else:
                         st.rerun()
             st.markdown("---")
+
+        if page_count > 1:
+            col_prev, col_page, col_next = st.columns([0.3, 0.4, 0.3])
+            with col_prev:
+                if st.button("◀", key="chat_log_prev", disabled=st.session_state.chat_log_page == 0):
+                    st.session_state.chat_log_page -= 1
+                    st.rerun()
+            with col_page:
+                st.caption(f"{st.session_state.chat_log_page + 1} / {page_count}")
+            with col_next:
+                if st.button("▶", key="chat_log_next", disabled=st.session_state.chat_log_page >= page_count - 1):
+                    st.session_state.chat_log_page += 1
+                    st.rerun()
     else:
         st.info("저장된 채팅 기록이 없습니다.")
 
     st.markdown("---")
 
+    # 관리자용 성능 지표 패널 (최근 턴 기준 p50/p95)
+    if current_user in st.secrets.get("ADMIN_USERS", ["ori"]):
+        with st.expander("📊 성능 지표 (관리자)"):
+            metrics_summary = get_metrics_recorder().summary()
+            if metrics_summary:
+                st.table({
+                    phase: {"p50 (ms)": round(stats["p50"] * 1000, 1), "p95 (ms)": round(stats["p95"] * 1000, 1), "건수": stats["count"]}
+                    for phase, stats in metrics_summary.items()
+                })
+            else:
+                st.caption("아직 기록된 턴이 없습니다.")
+            st.code(get_metrics_recorder().prometheus_text(), language="text")
+            st.caption("LLM 연결 풀 / 요청 합치기")
+            st.json({"llm_gateway": llm_gateway.stats(), "single_flight": get_single_flight().stats()})
+
+    st.markdown("---")
+
     if st.button("로그아웃", key="logout_button", help="현재 세션을 종료하고 로그인 화면으로 돌아갑니다."):
         st.session_state["login"] = False
         st.session_state.clear()
         st.rerun()
 
-# --- [기존 대화 출력 로직 유지] ---
-for message in st.session_state.messages:
+# --- [기존 대화 출력 로직: 최근 메시지만 창(window)으로 출력] ---
+# 매 rerun마다 전체 기록을 다시 그리지 않도록 최근 history_window개 메시지만 출력하고,
+# 더 이전 메시지는 '이전 대화 더 보기'를 누를 때 HISTORY_PAGE_SIZE개씩 추가로 보여줍니다.
+def show_earlier_messages():
+    st.session_state.history_window += HISTORY_PAGE_SIZE
+
+hidden_count = max(0, len(st.session_state.messages) - 1 - st.session_state.history_window) # 0번은 시스템 메시지
+if hidden_count:
+    st.button(f"⬆️ 이전 대화 더 보기 ({hidden_count}개)", key="show_earlier_messages", on_click=show_earlier_messages)
+
+for message_index in range(hidden_count + 1, len(st.session_state.messages)):
+    message = st.session_state.messages[message_index]
     if message["role"] == "system":
         continue
     
-    avatar_icon = "ori_icon.png" if message["role"] == "assistant" else "user"
-    
-    with st.chat_message(message["role"], avatar=avatar_icon):
-        if "image_url" in message and message["image_url"]:
-            local_image_path = os.path.join("images", message["image_url"])
-            if os.path.exists(local_image_path):
-                st.image(local_image_path, caption="수술방 장비 세팅 예시", use_container_width=True)
-            else:
-                st.warning(f"이미지 파일을 찾을 수 없습니다: {message['image_url']}")
+    # 마크다운은 브라우저에서 렌더링되므로 서버에서 미리 계산해 둘 것이 없습니다. 보이는 창만 다시 그립니다.
+    with st.chat_message(message["role"], avatar="ori_icon.png" if message["role"] == "assistant" else "user"):
+        if message.get("image_url"):
+            render_chat_image(message["image_url"], key=f"original_image_{message_index}")
         st.markdown(message["content"])
 
 # --- [유저 입력 처리 로직 유지] ---
 if prompt := st.chat_input("어떤 수술 준비를 도와드릴까요?"):
     st.session_state.show_guidelines = False
+    turn_metrics = TurnMetrics(model=st.session_state["perplexity_model"], user_chars=len(prompt))
 
     if st.session_state.current_chat_id is None:
         chat_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
         st.session_state.current_chat_id = chat_id
-        st.session_state.chat_logs[chat_id] = {
-            "title": prompt,
-            "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "messages": []
-        }
+        chat_store.create_chat(chat_owner, chat_id, prompt, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    st.session_state.chat_logs[st.session_state.current_chat_id]["messages"].append({"role": "user", "content": prompt})
+    add_message({"role": "user", "content": prompt})
 
     with st.chat_message("user"):
         st.markdown(prompt)
@@ -491,69 +548,156 @@ if prompt := st.chat_input("어떤 수술 준비를 도와드릴까요?"):
         with st.chat_message("assistant", avatar="ori_icon.png"):
             st.warning(response_content)
         
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": response_content,
-            "image_url": None
-        })
-        st.session_state.chat_logs[st.session_state.current_chat_id]["messages"].append({
+        add_message({
             "role": "assistant",
             "content": response_content,
             "image_url": None
         })
 
     else:
-        expanded_prompts = expand_query_with_synonyms(prompt)
-        
-        best_match = None
-        score = 0
-        idx = -1
-        
-        for current_prompt_candidate in expanded_prompts:
-            temp_match, temp_score, temp_idx = find_best_match(current_prompt_candidate, questions)
-            if temp_score > score:
-                best_match = temp_match
-                score = temp_score
-                idx = temp_idx
+        with turn_metrics.phase("canonicalize"):
+            normalized_prompt = match_index.normalize(prompt)
+        # 질문과 사전이 모두 대표어로 치환되어 있으므로 질의 하나로 매칭합니다.
+        with turn_metrics.phase("match"):
+            best_match, score, idx = find_best_match(prompt, match_index)
+        # 매칭된 별칭 -> 행 번호 -> 행 테이블의 답변/이미지
+        row_id, answer_from_sheet, current_image_file_name = (
+            resolve_row(sheet_data_loaded, idx) if best_match is not None else (None, None, None)
+        )
+        turn_metrics.set(match_score=score, matched_row=row_id)
 
         if best_match is not None and idx != -1:
-            answer_from_sheet = answers[idx]
-            current_image_file_name = image_urls[idx] if idx < len(image_urls) else None
             
-            messages_for_perplexity = [
-                {"role": "system", "content": f"다음은 수술실 관련 질문에 대한 정보입니다. 이 정보를 바탕으로 사용자 질문에 핵심만 간결하게 요약해서 답변하세요. 필요하다면 번호 매기기와 아이콘과 표를 사용하세요. 불필요한 설명은 생략하세요. \n\n정보: {answer_from_sheet}"},
-                {"role": "user", "content": prompt}
-            ]
+            # 점수가 충분히 높고 미리 만든 요약(summaries.py)이 있으면 네트워크 호출 없이 바로 보여줍니다.
+            stored_summary = None
+            if score >= SUMMARY_SCORE_THRESHOLD:
+                stored_summary = summary_store.get(sheet_data_loaded['row_hashes'][row_id], st.session_state["perplexity_model"])
+            turn_metrics.set(summary_hit=stored_summary is not None)
             
-            stream = client.chat.completions.create(
-                model=st.session_state["perplexity_model"],
-                messages=messages_for_perplexity,
-                stream=True,
-            )
+            if stored_summary is not None:
+                response_from_perplexity = stored_summary
+                with st.chat_message("assistant", avatar="ori_icon.png"):
+                    if current_image_file_name:
+                        render_chat_image(current_image_file_name, key=f"original_image_{len(st.session_state.messages)}")
+                    st.markdown(response_from_perplexity)
+            else:
+                # 답변 셀 전체 대신 질문과 관련 있는 줄만 토큰 예산 안에서 골라 보냅니다.
+                with turn_metrics.phase("pack_context"):
+                    runner_ups = find_runner_ups(
+                        prompt, match_index, sheet_data_loaded['alias_rows'], idx, score,
+                        score_delta=RUNNER_UP_SCORE_DELTA, limit=MAX_RUNNER_UPS,
+                    )
+                    context_for_perplexity, context_stats = pack_context(
+                        prompt, answer_from_sheet, token_budget=CONTEXT_TOKEN_BUDGET,
+                        runner_up_answers=[(questions[i], resolve_row(sheet_data_loaded, i)[1]) for i, _ in runner_ups],
+                    )
+                turn_metrics.set(**context_stats)
             
-            response_from_perplexity = ""
-            with st.chat_message("assistant", avatar="ori_icon.png"):
-                if current_image_file_name:
-                    local_image_path = os.path.join("images", current_image_file_name)
-                    if os.path.exists(local_image_path):
-                        st.image(local_image_path, caption="수술방 장비 세팅 예시", use_container_width=True)
-                    else:
-                        st.warning(f"이미지 파일을 찾을 수 없습니다: {current_image_file_name}")
-                
-                message_placeholder = st.empty()
-                for chunk in stream:
-                    if chunk.choices[0].delta.content is not None:
-                        response_from_perplexity += chunk.choices[0].delta.content
-                        message_placeholder.markdown(response_from_perplexity + "▌")
+                messages_for_perplexity = [
+                    {"role": "system", "content": f"다음은 수술실 관련 질문에 대한 정보입니다. 이 정보를 바탕으로 사용자 질문에 핵심만 간결하게 요약해서 답변하세요. 필요하다면 번호 매기기와 아이콘과 표를 사용하세요. 불필요한 설명은 생략하세요. \n\n정보: {context_for_perplexity}"},
+                    {"role": "user", "content": prompt}
+                ]
+            
+                # 같은 행 + 같은 정보(보낸 context) + 같은 (정규화된) 질문 + 같은 모델이면 캐시된 답변을 그대로 사용합니다.
+                cache_key = answer_cache.make_key(
+                    row_id, context_for_perplexity, normalized_prompt, st.session_state["perplexity_model"]
+                )
+                cached_response = answer_cache.get(cache_key)
+                turn_metrics.set(
+                    cache_hit=cached_response is not None,
+                    prompt_chars=sum(len(m["content"]) for m in messages_for_perplexity),
+                )
+            
+                if cached_response is None:
+                    request_started_at = time.perf_counter()
+                    with turn_metrics.phase("llm_request"):
+                        # 같은 캐시 키의 요청이 이미 진행 중이면 새로 보내지 않고 그 스트림을 처음부터 함께 받습니다.
+                        flight, flight_leader = get_single_flight().join(
+                            cache_key,
+                            lambda model=st.session_state["perplexity_model"], messages=messages_for_perplexity:
+                                llm_gateway.open_chat_stream(model, messages),
+                            on_done=lambda text, key=cache_key: answer_cache.put(key, text),
+                        )
+                        flight.wait_started(timeout=FIRST_TOKEN_SLO or None)
+                    turn_metrics.set(coalesced=not flight_leader)
+            
+                response_from_perplexity = ""
+                with st.chat_message("assistant", avatar="ori_icon.png"):
+                    if current_image_file_name:
+                        # 이 답변은 messages의 다음 위치에 저장되므로 대화 기록 출력과 같은 key를 사용합니다.
+                        render_chat_image(current_image_file_name, key=f"original_image_{len(st.session_state.messages)}")
                 
-                message_placeholder.markdown(response_from_perplexity)
+                    message_placeholder = st.empty()
+                    if cached_response is not None:
+                        response_from_perplexity = cached_response
+                        message_placeholder.markdown(response_from_perplexity)
+                    else:
+                        answering_flight = flight
+                        llm_path = "primary"
+                        slo_remaining = FIRST_TOKEN_SLO - (time.perf_counter() - request_started_at)
+                        if FIRST_TOKEN_SLO and not flight.wait_first_token(timeout=max(0.0, slo_remaining)):
+                            # 첫 토큰 목표를 넘김: 시트 원문을 바로 보여주고, 빠른 모델이 있으면 같은 요청을 하나 더 보내
+                            # 먼저 첫 토큰을 보낸 쪽의 답변으로 원문을 바꿉니다. 진 쪽은 다른 세션이 기다리지 않으면 취소됩니다.
+                            message_placeholder.markdown(f"{answer_from_sheet}\n\n{SLO_FALLBACK_NOTE}")
+                            contenders = [flight]
+                            hedge_model = st.session_state["hedge_model"]
+                            hedge_response = None
+                            if hedge_model and hedge_model != st.session_state["perplexity_model"]:
+                                hedge_key = answer_cache.make_key(row_id, context_for_perplexity, normalized_prompt, hedge_model)
+                                hedge_response = answer_cache.get(hedge_key)
+                                if hedge_response is None:
+                                    hedge_flight, _ = get_single_flight().join(
+                                        hedge_key,
+                                        lambda model=hedge_model, messages=messages_for_perplexity:
+                                            llm_gateway.open_chat_stream(model, messages),
+                                        on_done=lambda text, key=hedge_key: answer_cache.put(key, text),
+                                    )
+                                    contenders.append(hedge_flight)
+                            answering_flight = None
+                            if hedge_response is None:
+                                answering_flight = first_to_respond(contenders, timeout=llm_gateway.total_timeout)
+                            for contender in contenders:
+                                if contender is not answering_flight:
+                                    contender.release()
+                            if answering_flight is flight:
+                                llm_path = "primary_late"
+                            elif answering_flight is not None or hedge_response is not None:
+                                llm_path = "hedge"
+                            else:
+                                llm_path = "sheet"
+                            turn_metrics.set(slo_fallback=True, hedged=len(contenders) > 1 or hedge_response is not None)
+                        turn_metrics.set(llm_path=llm_path)
+
+                        if answering_flight is None:
+                            # 캐시된 빠른 모델 답변, 또는 (모두 실패/시간 초과) 시트 원문을 답변으로 남깁니다.
+                            response_from_perplexity = hedge_response or answer_from_sheet
+                            message_placeholder.markdown(response_from_perplexity)
+                        else:
+                            try:
+                                # 청크를 모아 50ms마다 한 번씩만 화면을 갱신합니다.
+                                response_from_perplexity, stream_stats = render_text_stream(
+                                    answering_flight.subscribe(), message_placeholder,
+                                    usage=answering_flight.usage, started_at=request_started_at,
+                                )
+                            except Exception as e:
+                                # 스트림이 실패하거나 시간 제한을 넘으면 받은 부분까지(없으면 시트 원문)를 답변으로 남깁니다.
+                                partial_response = "".join(answering_flight.parts)
+                                response_from_perplexity = partial_response or answer_from_sheet
+                                message_placeholder.markdown(response_from_perplexity)
+                                st.warning(f"⚠️ 답변 생성이 중단되었습니다: {type(e).__name__}")
+                                turn_metrics.set(llm_path="partial" if partial_response else "sheet", llm_error=type(e).__name__)
+                            else:
+                                st.session_state["last_stream_stats"] = stream_stats
+                                turn_metrics.timings["ttft"] = stream_stats["ttft"]
+                                if stream_stats["ttft"] is not None:
+                                    turn_metrics.timings["stream"] = stream_stats["total"] - stream_stats["ttft"]
+                                turn_metrics.set(
+                                    prompt_tokens=stream_stats["usage"].get("prompt_tokens"),
+                                    completion_tokens=stream_stats["usage"].get("completion_tokens"),
+                                )
+            turn_metrics.set(completion_chars=len(response_from_perplexity))
             
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": response_from_perplexity,
-                "image_url": current_image_file_name
-            })
-            st.session_state.chat_logs[st.session_state.current_chat_id]["messages"].append({
+            add_message({
                 "role": "assistant",
                 "content": response_from_perplexity,
                 "image_url": current_image_file_name
@@ -568,13 +712,10 @@ if prompt := st.chat_input("어떤 수술 준비를 도와드릴까요?"):
             with st.chat_message("assistant", avatar="ori_icon.png"):
                 st.markdown(response_content)
             
-            st.session_state.messages.append({
+            add_message({
                 "role": "assistant",
                 "content": response_content,
                 "image_url": None
             })
-            st.session_state.chat_logs[st.session_state.current_chat_id]["messages"].append({
-                "role": "assistant",
-                "content": response_content,
-                "image_url": None
-            })
\ No newline at end of file
+
+    st.session_state["last_turn_metrics"] = get_metrics_recorder().record(turn_metrics)
@@ -0,0 +1,130 @@
+# 로컬 하이브리드 검색 엔진 (글자 n-gram TF-IDF 벡터 + RapidFuzz 재정렬)
+# fuzz.ratio는 문자열 전체를 비교하므로 어순이 바뀌거나 일부만 입력한 질문("TUC 장비")을 놓치고,
+# 별칭을 늘릴수록 매 턴 전체 목록을 훑는 시간이 늘어납니다.
+# 로딩 시 정규화된 질문들의 글자 2/3-gram TF-IDF 벡터를 희소 행렬(scipy.sparse)로 만들어 두고,
+# 질의마다 질의에 나온 n-gram 열만 읽는 희소 행렬-벡터 곱 한 번으로 코사인 유사도 상위 후보를 고른 뒤
+# 그 후보들만 RapidFuzz로 다시 점수를 매깁니다. (네트워크/GPU 없이 동작)
+import copy
+from array import array
+from collections import Counter
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from scipy import sparse
+
+from match_index import MatchIndex
+
+NGRAM_SIZES = (2, 3)
+
+
+def char_ngrams(text, sizes=NGRAM_SIZES):
+    # 앞뒤에 공백을 붙여 단어 시작/끝도 n-gram에 드러나게 합니다. (" tu", "tuc", "uc ")
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for n in sizes for i in range(len(padded) - n + 1))
+
+
+def hybrid_scores(query, candidates):
+    # 재정렬 점수 (0~100, find_best_match의 임계값과 같은 척도)
+    # - fuzz.ratio: 기존과 같은 전체 문자열 유사도
+    # - fuzz.token_sort_ratio: 어순이 바뀐 질문 ("세팅 TUC 37번방")
+    # - fuzz.token_set_ratio: 일부 단어만 입력한 질문 ("TUC 장비"). 짧은 질의가 아무 질문에나 100점이 되지 않도록
+    #   ratio와 평균을 냅니다.
+    ratio = process.cdist([query], candidates, scorer=fuzz.ratio, dtype=np.float64)[0]
+    token_sort = process.cdist([query], candidates, scorer=fuzz.token_sort_ratio, dtype=np.float64)[0]
+    token_set = process.cdist([query], candidates, scorer=fuzz.token_set_ratio, dtype=np.float64)[0]
+    return np.maximum(np.maximum(ratio, token_sort), (ratio + token_set) / 2)
+
+
+class NgramVectorIndex:
+    def __init__(self, texts):
+        # 행마다 Counter를 들고 있지 않도록 (열 번호, 개수)를 평평한 배열에 바로 쌓아 희소 행렬을 만듭니다.
+        self.vocabulary = {}
+        indices = array("i")
+        counts = array("f")
+        indptr = array("q", [0])
+        for text in texts:
+            for gram, count in char_ngrams(text).items():
+                indices.append(self.vocabulary.setdefault(gram, len(self.vocabulary)))
+                counts.append(count)
+            indptr.append(len(indices))
+        indices = np.frombuffer(indices, dtype=np.int32)
+        n_docs = len(indptr) - 1
+        # 부드러운 IDF: log((1 + N) / (1 + df)) + 1
+        document_frequency = np.bincount(indices, minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + n_docs) / (1 + document_frequency)) + 1).astype(np.float32)
+        self.matrix = self._weight(np.frombuffer(counts, dtype=np.float32).copy(), indices, np.frombuffer(indptr, dtype=np.int64))
+
+    def _weight(self, counts, indices, indptr):
+        # 행마다 L2 정규화한 TF-IDF 벡터 (float32). 중간 행렬을 만들지 않도록 값 배열을 그 자리에서 바꿉니다.
+        # 질의 때 열 단위로 읽으므로 CSC 형식으로 보관합니다.
+        counts *= self.idf[indices]
+        row_lengths = np.diff(indptr)
+        norms = np.zeros(len(row_lengths), dtype=np.float32)
+        nonempty = row_lengths > 0
+        norms[nonempty] = np.sqrt(np.add.reduceat(counts * counts, indptr[:-1][nonempty]))
+        norms[norms == 0] = 1.0
+        counts /= np.repeat(norms, row_lengths)
+        return sparse.csr_matrix((counts, indices, indptr), shape=(len(row_lengths), len(self.vocabulary))).tocsc()
+
+    def _query_weights(self, text):
+        counts = char_ngrams(text)
+        cols = [self.vocabulary[g] for g in counts if g in self.vocabulary]
+        values = np.array([counts[g] for g in counts if g in self.vocabulary], dtype=np.float32)
+        return np.asarray(cols, dtype=np.int32), values
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def extended(self, new_texts):
+        # 기존 어휘/IDF로 새 행만 벡터화해 덧붙인 새 인덱스를 반환합니다.
+        # (처음 보는 n-gram은 무시되며, 다음 시트 전체 갱신 때 어휘가 다시 만들어집니다.)
+        rows = [self._query_weights(text) for text in new_texts]
+        new_matrix = self._weight(
+            np.concatenate([values for _, values in rows] or [np.empty(0, dtype=np.float32)]),
+            np.concatenate([cols for cols, _ in rows] or [np.empty(0, dtype=np.int32)]),
+            np.cumsum([0] + [len(cols) for cols, _ in rows]),
+        )
+        extended = copy.copy(self)
+        extended.matrix = sparse.vstack([self.matrix, new_matrix], format="csc")
+        return extended
+
+    def cosine_top_k(self, text, limit):
+        # (후보 인덱스, 코사인 유사도) - 유사도 0인 질문은 후보에서 뺍니다.
+        cols, values = self._query_weights(text)
+        if len(cols) == 0 or len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        weights = values * self.idf[cols]
+        weights /= np.linalg.norm(weights)
+        # 질의에 나온 n-gram 열만 잘라 곱하므로 비용은 전체 질문 수가 아니라 그 열들의 0 아닌 값 수에 비례합니다.
+        scores = self.matrix[:, cols] @ weights
+        candidate_idx = np.flatnonzero(scores)
+        if len(candidate_idx) > limit:
+            candidate_idx = candidate_idx[np.argpartition(-scores[candidate_idx], limit - 1)[:limit]]
+        return candidate_idx, scores[candidate_idx]
+
+
+class HybridMatchIndex(MatchIndex):
+    # MatchIndex와 같은 인터페이스(search/find_best_match)로 쓸 수 있는 하이브리드 인덱스
+    # candidates: 코사인 유사도로 고른 뒤 RapidFuzz로 다시 점수를 매길 후보 수
+    def __init__(self, questions, use_jamo=False, canonicalizer=None, candidates=64):
+        super().__init__(questions, use_jamo=use_jamo, canonicalizer=canonicalizer)
+        self.candidates = candidates
+        self.vectors = NgramVectorIndex(self.normalized_questions)
+
+    def extended(self, new_questions):
+        new_questions = list(new_questions)
+        extended = super().extended(new_questions)
+        extended.vectors = self.vectors.extended(extended.normalized_questions[len(self.questions):])
+        return extended
+
+    def search(self, user_input, limit=5):
+        if not self.questions or limit <= 0:
+            return []
+        query = self.normalize(user_input)
+        candidate_idx, _ = self.vectors.cosine_top_k(query, max(self.candidates, limit))
+        if len(candidate_idx) == 0:
+            return super().search(user_input, limit) # 겹치는 n-gram이 하나도 없으면 전체 비교로 대신함
+        scores = hybrid_scores(query, [self.normalized_questions[i] for i in candidate_idx])
+        # 동점이면 앞쪽(인덱스가 작은) 질문이 먼저 오도록 정렬합니다.
+        order = np.lexsort((candidate_idx, -scores))[:limit]
+        return [(self.questions[candidate_idx[i]], float(scores[i]), int(candidate_idx[i])) for i in order]
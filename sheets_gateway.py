@@ -0,0 +1,92 @@
+# 프로세스 전체에서 공유하는 구글 시트 게이트웨이
+# 서비스 계정 인증, HTTP 커넥션 풀, Spreadsheet/Worksheet 핸들을 한 번만 만들어 재사용합니다.
+# 지식 베이스 로더와 '정보 저장' 모두 이 게이트웨이를 통해 시트에 접근합니다.
+import threading
+from datetime import datetime, timedelta, timezone
+
+import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+
+SHEET_SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
+                'https://www.googleapis.com/auth/drive']
+
+
+class SheetsGateway:
+    # 토큰 만료 5분 전에 미리 갱신해서, 요청 도중 401 -> 재인증 -> 재시도가 일어나지 않게 합니다.
+    TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+    def __init__(self, json_key_info, sheet_id, timeout=(5, 30), pool_size=10):
+        self.sheet_id = sheet_id
+        self.json_key_info = json_key_info
+        self.timeout = timeout # (연결, 읽기) 초
+        self.pool_size = pool_size
+        # 인증 정보와 클라이언트는 첫 시트 접근 때 만듭니다. 키가 잘못돼도 생성은 실패하지 않고,
+        # 오류는 시트를 읽고 쓰는 쪽(지식 베이스 갱신, 쓰기 대기열)에서 다른 시트 오류와 같이 처리됩니다.
+        self.credentials = None
+        self.client = None
+        self._token_request = None
+        self._spreadsheet = None
+        self._worksheets = {}
+        self._lock = threading.RLock()
+        self.token_refreshes = 0
+
+    def _connect(self):
+        if self.client is not None:
+            return
+        credentials = service_account.Credentials.from_service_account_info(
+            self.json_key_info, scopes=SHEET_SCOPES
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        # 토큰 발급 요청도 같은 커넥션 풀(adapter)을 쓰는 세션으로 보냅니다.
+        token_session = requests.Session()
+        token_session.mount("https://", adapter)
+        self._token_request = Request(token_session)
+        session = AuthorizedSession(credentials, auth_request=self._token_request)
+        session.mount("https://", adapter)
+        client = gspread.authorize(credentials, session=session)
+        client.set_timeout(self.timeout)
+        self.credentials = credentials
+        self.client = client
+
+    def _ensure_token(self):
+        self._connect()
+        expiry = self.credentials.expiry # google-auth는 UTC 기준 naive datetime을 사용합니다.
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        if not self.credentials.valid or (expiry is not None and expiry - now < self.TOKEN_REFRESH_MARGIN):
+            self.credentials.refresh(self._token_request)
+            self.token_refreshes += 1
+
+    def spreadsheet(self):
+        with self._lock:
+            self._ensure_token()
+            if self._spreadsheet is None:
+                self._spreadsheet = self.client.open_by_key(self.sheet_id)
+            return self._spreadsheet
+
+    def worksheet(self, title):
+        # 없는 탭이면 gspread.exceptions.WorksheetNotFound가 그대로 올라갑니다. (캐시하지 않음)
+        with self._lock:
+            self._ensure_token()
+            if title not in self._worksheets:
+                self._worksheets[title] = self.spreadsheet().worksheet(title)
+            return self._worksheets[title]
+
+    def get_lastUpdateTime(self):
+        return self.spreadsheet().get_lastUpdateTime()
+
+    def reset(self):
+        # 탭 이름이 바뀌는 등 캐시된 핸들이 더 이상 유효하지 않을 때 호출합니다.
+        with self._lock:
+            self._spreadsheet = None
+            self._worksheets = {}
+
+    def run(self, fn, *args):
+        # fn(self, *args)를 실행하고, API 오류가 나면 핸들을 버려 다음 호출에서 다시 찾도록 합니다.
+        try:
+            return fn(self, *args)
+        except gspread.exceptions.APIError:
+            self.reset()
+            raise
@@ -0,0 +1,169 @@
+# 같은 LLM 요청 합치기 (single-flight)
+# 교대 시간처럼 여러 사람이 거의 같은 질문을 몇 초 안에 보내면, 답변 캐시에 들어가기 전이라 모두 캐시를 놓치고
+# 같은 내용의 스트리밍 요청을 각자 보냅니다. 같은 키(답변 캐시 키와 동일)의 요청이 진행 중이면 새로 보내지 않고
+# 진행 중인 스트림을 구독해 처음 조각부터 함께 받습니다.
+#
+# 실제 요청은 첫 호출자가 아니라 백그라운드 스레드가 끝까지 읽어 공유 버퍼에 쌓습니다.
+# 첫 호출자의 rerun이 중간에 끊겨도 다른 구독자는 답변을 끝까지 받고, 완료된 답변은 on_done으로 캐시에 저장됩니다.
+import threading
+import time
+
+from streaming import iter_stream_text
+
+
+class FlightCancelled(Exception):
+    pass
+
+
+class Flight:
+    # 진행 중인 요청 하나. 텍스트 조각은 Condition 아래에서 parts에 쌓이고 구독자는 자기 위치부터 읽습니다.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.parts = []
+        self.usage = {} # 마지막 청크의 토큰 사용량 (iter_stream_text가 채움)
+        self.started = False # 스트림이 열렸는지 (요청 전송 완료)
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.interested = 0 # join()한 호출자 중 아직 release()하지 않은 수
+        self.cancelled = False
+        self._stream = None
+        self._listeners = [] # 조각이 오거나 끝날 때 set()할 threading.Event (first_to_respond)
+
+    def _notify(self):
+        self._cond.notify_all()
+        for event in self._listeners:
+            event.set()
+
+    def _run(self, open_stream, on_done):
+        try:
+            stream = open_stream()
+            with self._cond:
+                self._stream = stream
+                self.started = True
+                cancelled = self.cancelled
+                self._notify()
+            if cancelled:
+                stream.close()
+                raise FlightCancelled()
+            for text in iter_stream_text(stream, self.usage):
+                with self._cond:
+                    self.parts.append(text)
+                    self._notify()
+        except Exception as e:
+            self.error = FlightCancelled() if self.cancelled else e
+        if self.error is None and on_done is not None:
+            try:
+                on_done("".join(self.parts))
+            except Exception as e:
+                self.error = e
+        with self._cond:
+            self.started = True
+            self.done = True
+            self._notify()
+
+    def wait_started(self, timeout=None):
+        # 스트림이 열릴 때까지(또는 실패할 때까지) 기다립니다. 실패는 subscribe()에서 예외로 전달됩니다.
+        with self._cond:
+            return self._cond.wait_for(lambda: self.started, timeout)
+
+    def wait_first_token(self, timeout=None):
+        # timeout 안에 첫 조각이 왔으면 True (끝났는데 조각이 없으면 - 실패 - False)
+        with self._cond:
+            self._cond.wait_for(lambda: self.parts or self.done, timeout)
+            return bool(self.parts)
+
+    def release(self):
+        # 이 호출자는 더 이상 결과를 기다리지 않습니다. 아무도 기다리지 않는 요청은 취소해 연결을 닫습니다.
+        with self._cond:
+            self.interested -= 1
+            if self.interested > 0 or self.done or self.cancelled:
+                return
+            self.cancelled = True
+            stream = self._stream
+        if stream is not None:
+            stream.close()
+
+    def subscribe(self):
+        # 처음 조각부터 끝까지 텍스트를 내보내는 제너레이터. 요청이 실패했으면 같은 예외를 다시 발생시킵니다.
+        with self._cond:
+            self.subscribers += 1
+        position = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: position < len(self.parts) or self.done)
+                new_parts = self.parts[position:]
+                position += len(new_parts)
+                finished = self.done
+            yield from new_parts
+            if finished and position >= len(self.parts):
+                break
+        if self.error is not None:
+            raise self.error
+
+
+def first_to_respond(flights, timeout=None):
+    # 여러 요청 중 가장 먼저 첫 조각을 보낸 Flight를 반환합니다. 모두 실패했거나 timeout이 지나면 None.
+    event = threading.Event()
+    for flight in flights:
+        with flight._cond:
+            flight._listeners.append(event)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+        while True:
+            event.clear()
+            for flight in flights:
+                if flight.parts:
+                    return flight
+            if all(flight.done for flight in flights):
+                return None
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            event.wait(remaining)
+    finally:
+        for flight in flights:
+            with flight._cond:
+                flight._listeners.remove(event)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {} # 키 -> 진행 중인 Flight
+        self.started = 0 # 실제로 보낸 요청 수
+        self.coalesced = 0 # 진행 중인 요청에 합쳐진 호출 수
+
+    def join(self, key, open_stream, on_done=None):
+        # (Flight, 새 요청을 시작했는지)를 반환합니다. 결과가 더 이상 필요 없으면 flight.release()를 호출합니다.
+        # open_stream: 인자 없이 호출하면 스트림을 여는 함수. on_done: 완료된 답변 텍스트를 받는 함수 (캐시 저장 등)
+        # on_done이 끝난 뒤에 진행 목록에서 빠지므로, 그 사이에 들어온 같은 요청은 캐시나 진행 중인 요청 중 하나를 반드시 봅니다.
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                with flight._cond:
+                    joined = not flight.cancelled # 취소된 요청에는 합치지 않고 새로 보냅니다.
+                    if joined:
+                        flight.interested += 1
+                if joined:
+                    self.coalesced += 1
+                    return flight, False
+            flight = Flight()
+            flight.interested = 1
+            self._flights[key] = flight
+            self.started += 1
+
+        def run():
+            try:
+                flight._run(open_stream, on_done)
+            finally:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+
+        threading.Thread(target=run, name="llm-flight", daemon=True).start()
+        return flight, True
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), "started": self.started, "coalesced": self.coalesced}
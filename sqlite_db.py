@@ -0,0 +1,34 @@
+# 로컬 SQLite 파일 공용 도우미 (스냅샷, 요약, 채팅 기록, 시트 쓰기 대기열)
+# 연결 하나 = 트랜잭션 하나. 블록이 끝나면 커밋(예외면 롤백)하고 연결을 닫습니다.
+# 여러 세션/프로세스가 같은 파일을 쓰므로 연결을 오래 붙잡지 않고 작업마다 새로 엽니다.
+import os
+import sqlite3
+from contextlib import contextmanager
+
+BUSY_TIMEOUT = 10 # 다른 연결이 쓰는 중일 때 기다리는 최대 시간(초)
+
+
+@contextmanager
+def connect(path, immediate=False):
+    # immediate=True면 시작할 때 쓰기 잠금을 잡아, 읽고 나서 고치는 동안 다른 프로세스가 끼어들지 못하게 합니다.
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    try:
+        with conn:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_db(path, schema, wal=False):
+    # 상위 폴더를 만들고 스키마(CREATE ... IF NOT EXISTS 문 목록)를 적용합니다.
+    # wal=True면 읽기와 쓰기가 서로 막지 않도록 WAL 모드로 바꿉니다. (파일에 저장되므로 한 번이면 됨)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with connect(path) as conn:
+        if wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+        for statement in schema:
+            conn.execute(statement)
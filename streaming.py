@@ -0,0 +1,73 @@
+# Perplexity 스트리밍 응답 렌더러
+# 청크마다 전체 답변을 placeholder에 다시 보내면 답변 길이에 대해 제곱으로 비용이 늘어나므로,
+# 청크는 리스트에 모아 두고 일정 시간(flush_interval) 또는 일정 글자 수(flush_chars)마다 한 번만 갱신합니다.
+import time
+
+
+def iter_stream_text(stream, usage=None):
+    # OpenAI 호환 스트림에서 텍스트 조각만 꺼냅니다.
+    # usage 딕셔너리를 넘기면 마지막 청크에 실려 오는 토큰 사용량(prompt/completion_tokens)을 채웁니다.
+    for chunk in stream:
+        chunk_usage = getattr(chunk, "usage", None)
+        if usage is not None and chunk_usage is not None:
+            usage["prompt_tokens"] = getattr(chunk_usage, "prompt_tokens", None)
+            usage["completion_tokens"] = getattr(chunk_usage, "completion_tokens", None)
+        if chunk.choices and chunk.choices[0].delta.content is not None:
+            yield chunk.choices[0].delta.content
+
+
+def render_stream(stream, placeholder, started_at=None, flush_interval=0.05, flush_chars=400, cursor="▌"):
+    # (최종 답변, 통계)를 반환합니다.
+    # 통계: ttft(첫 토큰까지 걸린 초), total(스트림 전체 초), chunks, flushes, chars, usage(토큰 수),
+    #       max_gap(첫 토큰 이후 청크 사이의 가장 긴 공백 초 - 화면이 멈춰 보인 시간)
+    usage = {}
+    return render_text_stream(
+        iter_stream_text(stream, usage), placeholder, usage=usage, started_at=started_at,
+        flush_interval=flush_interval, flush_chars=flush_chars, cursor=cursor,
+    )
+
+
+def render_text_stream(texts, placeholder, usage=None, started_at=None, flush_interval=0.05, flush_chars=400, cursor="▌"):
+    # render_stream과 같지만 청크 객체 대신 텍스트 조각을 받습니다. (singleflight 구독 등)
+    # usage: 스트림이 끝날 때까지 채워지는 토큰 사용량 딕셔너리 (통계에 그대로 실림)
+    started_at = time.perf_counter() if started_at is None else started_at
+    usage = {} if usage is None else usage
+    parts = []
+    pending_chars = 0
+    last_flush = time.perf_counter()
+    first_token_at = None
+    last_chunk_at = None
+    max_gap = 0.0
+    chunks = 0
+    flushes = 0
+
+    for text in texts:
+        now = time.perf_counter()
+        if first_token_at is None:
+            first_token_at = now
+        else:
+            max_gap = max(max_gap, now - last_chunk_at)
+        last_chunk_at = now
+        parts.append(text)
+        chunks += 1
+        pending_chars += len(text)
+        # 첫 조각은 바로 그려서 ttft가 화면에 보인 시각과 같게 합니다.
+        if flushes == 0 or now - last_flush >= flush_interval or pending_chars >= flush_chars:
+            placeholder.markdown("".join(parts) + cursor)
+            last_flush = now
+            pending_chars = 0
+            flushes += 1
+
+    response = "".join(parts)
+    placeholder.markdown(response)
+    finished_at = time.perf_counter()
+    stats = {
+        "ttft": (first_token_at - started_at) if first_token_at is not None else None,
+        "total": finished_at - started_at,
+        "chunks": chunks,
+        "flushes": flushes + 1,
+        "chars": len(response),
+        "usage": usage,
+        "max_gap": max_gap,
+    }
+    return response, stats
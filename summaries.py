@@ -0,0 +1,176 @@
+# 행별 요약 미리 만들기 (배치 작업) + 요약 저장소
+# 대부분의 질문은 시트의 몇몇 행에 반복해서 매칭되므로, 행마다 요약을 미리 만들어 지식 베이스 스냅샷과 같은
+# SQLite 파일(row_summaries 테이블)에 저장해 둡니다. 매칭 점수가 충분히 높으면 앱은 저장된 요약을
+# 네트워크 호출 없이 바로 보여주고, 실시간 LLM은 점수가 낮거나 처음 보는 질문에만 사용합니다.
+# 요약은 (행 내용 해시, 모델)을 키로 저장되므로 시트에서 행을 고치면 그 행은 다시 생성할 때까지 사용되지 않습니다.
+#
+# 사용법:
+#   PERPLEXITY_API_KEY=... python summaries.py                        # data/kb_snapshot.sqlite3의 모든 행
+#   python summaries.py --base-url http://127.0.0.1:8765 --workers 16 # 로컬 스텁 서버
+#   python summaries.py --fixture benchmarks/fixture.json --snapshot /tmp/kb.sqlite3
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from openai import OpenAI
+
+from kb_snapshot import load_snapshot
+from knowledge_base import build_knowledge_base, first_alias_by_row
+from sqlite_db import connect, init_db
+
+SUMMARY_SYSTEM_PROMPT = (
+    "다음은 수술실 관련 질문에 대한 정보입니다. 이 정보를 수술실 간호사가 바로 보고 따라할 수 있도록 "
+    "핵심만 간결하게 요약하세요. 필요하다면 번호 매기기와 아이콘과 표를 사용하세요. 불필요한 설명은 생략하세요. "
+    "한국어로 답변하세요.\n\n정보: {answer}"
+)
+
+
+class SummaryStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._memo = {} # (행 해시, 모델) -> 요약 - 한 번 읽은 요약은 다시 조회하지 않음
+        init_db(path, [
+            "CREATE TABLE IF NOT EXISTS row_summaries ("
+            "row_hash TEXT, model TEXT, summary TEXT, created_at REAL, "
+            "PRIMARY KEY (row_hash, model))"
+        ])
+
+    def _connect(self):
+        return connect(self.path)
+
+    def get(self, row_hash, model):
+        key = (row_hash, model)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT summary FROM row_summaries WHERE row_hash = ? AND model = ?", key
+            ).fetchone()
+        summary = row[0] if row else None
+        if summary is not None:
+            with self._lock:
+                self._memo[key] = summary
+        return summary
+
+    def existing_hashes(self, model):
+        with self._connect() as conn:
+            return {r[0] for r in conn.execute("SELECT row_hash FROM row_summaries WHERE model = ?", (model,))}
+
+    def put(self, row_hash, model, summary):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO row_summaries (row_hash, model, summary, created_at) VALUES (?, ?, ?, ?)",
+                (row_hash, model, summary, time.time()),
+            )
+        with self._lock:
+            self._memo[(row_hash, model)] = summary
+
+    def prune(self, keep_hashes):
+        # 지식 베이스에 더 이상 없는 행의 요약을 지웁니다.
+        with self._connect() as conn:
+            stale = [r[0] for r in conn.execute("SELECT DISTINCT row_hash FROM row_summaries")
+                     if r[0] not in keep_hashes]
+            conn.executemany("DELETE FROM row_summaries WHERE row_hash = ?", [(h,) for h in stale])
+        with self._lock:
+            self._memo = {k: v for k, v in self._memo.items() if k[0] in keep_hashes}
+        return len(stale)
+
+
+def summary_jobs(kb):
+    # 행마다 (행 해시, 대표 질문, 답변) 하나씩. 별칭이 여러 개인 행은 첫 번째 별칭을 사용하고,
+    # 내용이 같은 행은 한 번만 생성합니다.
+    jobs = {}
+    for row_id, question in first_alias_by_row(kb).items():
+        row_hash = kb['row_hashes'][row_id]
+        answer = kb['row_answers'][row_id]
+        if row_hash not in jobs and str(answer).strip():
+            jobs[row_hash] = (row_hash, question, answer)
+    return list(jobs.values())
+
+
+def summarize_row(client, model, question, answer):
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT.format(answer=answer)},
+            {"role": "user", "content": question},
+        ],
+    )
+    return response.choices[0].message.content.strip()
+
+
+def generate_summaries(kb, client, model, store, workers=8, force=False, progress=None):
+    # 요약이 없는 행(force면 모든 행)을 스레드 풀로 생성해 저장합니다. (생성 수, 실패 목록)을 반환합니다.
+    jobs = summary_jobs(kb)
+    if not force:
+        existing = store.existing_hashes(model)
+        jobs = [job for job in jobs if job[0] not in existing]
+    generated = 0
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(summarize_row, client, model, question, answer): (row_hash, question)
+            for row_hash, question, answer in jobs
+        }
+        for future in as_completed(futures):
+            row_hash, question = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                failures.append((question, f"{type(e).__name__}: {e}"))
+                continue
+            if summary:
+                store.put(row_hash, model, summary)
+                generated += 1
+            if progress is not None:
+                progress(generated + len(failures), len(jobs))
+    return generated, failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", default=os.path.join(os.environ.get("ORI_DATA_DIR", "data"), "kb_snapshot.sqlite3"),
+                        help="지식 베이스 스냅샷이자 요약을 저장할 SQLite 파일")
+    parser.add_argument("--fixture", help="스냅샷 대신 읽을 시트 JSON 픽스처 (fake_sheets.py 형식)")
+    parser.add_argument("--model", default="sonar-pro")
+    parser.add_argument("--base-url", default=os.environ.get("PERPLEXITY_BASE_URL", "https://api.perplexity.ai"))
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--force", action="store_true", help="이미 요약이 있는 행도 다시 생성")
+    parser.add_argument("--prune", action="store_true", help="지식 베이스에 없는 행의 요약 삭제")
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, encoding="utf-8") as f:
+            sheet_values = json.load(f)
+    else:
+        snapshot = load_snapshot(args.snapshot)
+        if snapshot is None:
+            print(f"스냅샷이 없습니다: {args.snapshot} (앱을 한 번 실행하거나 --fixture를 지정하세요)")
+            return 1
+        sheet_values = snapshot[0]
+    kb = build_knowledge_base(sheet_values)
+
+    client = OpenAI(api_key=os.environ.get("PERPLEXITY_API_KEY", "local"), base_url=args.base_url)
+    store = SummaryStore(args.snapshot)
+
+    def progress(done, total):
+        print(f"\r{done}/{total}", end="", flush=True)
+
+    started = time.perf_counter()
+    generated, failures = generate_summaries(kb, client, args.model, store, args.workers, args.force, progress)
+    print(f"\n{generated} summaries generated in {time.perf_counter() - started:.1f}s, {len(failures)} failed")
+    for question, error in failures[:10]:
+        print(f"  {question}: {error}")
+    if args.prune:
+        print(f"{store.prune(set(kb['row_hashes'].values()))} stale summaries removed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
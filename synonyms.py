@@ -0,0 +1,83 @@
+# 동의어 정규화(canonicalization)
+# SYNONYM_MAP 전체를 하나의 정규식 alternation으로 컴파일해 두고,
+# 저장된 질문(로딩 시 한 번)과 사용자 질문(턴마다 한 번)을 대표어로 한 번에 치환합니다.
+# 질의를 N개로 확장하지 않으므로 사전이 수백 개로 늘어나도 매칭은 질의 1개로 끝납니다.
+import re
+
+from match_index import normalize_text
+
+# --- 기본 동의어 사전 (구글 시트 'Synonyms' 탭의 내용이 여기에 더해집니다) ---
+SYNONYM_MAP = {
+    "수술 준비": ["수술 세팅", "수술준비", "수술세팅", "세팅", "준비"],
+    "장비": ["기구", "물품"],
+    "방법": ["과정", "절차"],
+    "TUC": ["Tuc","tuc", "경요도", "요도절제술"],
+    "사용하는": ["필요한", "필요한 장비", "필요한 물품", "필요한 기구", "필요한 것", "사용하는 장비"]
+}
+
+SYNONYM_SHEET_NAME = "Synonyms"
+SYNONYM_MAIN_COLUMN = "대표어"
+SYNONYM_ALIASES_COLUMN = "동의어"
+
+
+def synonym_map_from_rows(rows):
+    # 'Synonyms' 탭의 get_all_values() 결과를 {대표어: [동의어, ...]}로 변환합니다.
+    # 동의어 칸은 '질문' 칸과 마찬가지로 콤마로 구분합니다.
+    if not rows or len(rows) < 2:
+        return {}
+    header = rows[0]
+    if SYNONYM_MAIN_COLUMN not in header or SYNONYM_ALIASES_COLUMN not in header:
+        return {}
+    main_col = header.index(SYNONYM_MAIN_COLUMN)
+    aliases_col = header.index(SYNONYM_ALIASES_COLUMN)
+
+    synonym_map = {}
+    for row in rows[1:]:
+        main_term = row[main_col].strip() if main_col < len(row) else ""
+        aliases_cell = row[aliases_col] if aliases_col < len(row) else ""
+        if not main_term:
+            continue
+        aliases = [a.strip() for a in aliases_cell.split(',') if a.strip()]
+        synonym_map.setdefault(main_term, []).extend(aliases)
+    return synonym_map
+
+
+def merge_synonym_maps(*synonym_maps):
+    merged = {}
+    for synonym_map in synonym_maps:
+        for main_term, synonyms in synonym_map.items():
+            merged.setdefault(main_term, [])
+            merged[main_term].extend(s for s in synonyms if s not in merged[main_term])
+    return merged
+
+
+class SynonymCanonicalizer:
+    def __init__(self, synonym_map):
+        self.synonym_map = synonym_map # 같은 치환기를 다시 만들 수 있도록 원본 사전도 보관 (kb_mmap 파일에 저장)
+        # 정규화된 동의어 -> 정규화된 대표어
+        self.replacements = {}
+        for main_term, synonyms in synonym_map.items():
+            canonical = normalize_text(main_term)
+            for term in [main_term, *synonyms]:
+                key = normalize_text(term)
+                if key:
+                    # 같은 단어가 여러 그룹에 있으면 먼저 등록된 대표어를 따릅니다.
+                    self.replacements.setdefault(key, canonical)
+
+        self.pattern = None
+        if self.replacements:
+            # 긴 단어부터 시도해야 "필요한 장비"가 "필요한"보다 먼저 치환됩니다.
+            terms = sorted(self.replacements, key=len, reverse=True)
+            self.pattern = re.compile("|".join(re.escape(t) for t in terms))
+
+    def __len__(self):
+        return len(self.replacements)
+
+    def _replace(self, match):
+        return self.replacements[match.group(0)]
+
+    def canonicalize(self, normalized_text):
+        # normalize_text()를 거친 문자열을 입력으로 받아 한 번의 패스로 치환합니다.
+        if self.pattern is None:
+            return normalized_text
+        return self.pattern.sub(self._replace, normalized_text)
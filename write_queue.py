@@ -0,0 +1,154 @@
+# '새 정보 입력' 제출을 위한 비동기 쓰기 대기열
+# 제출된 행은 먼저 로컬 SQLite 저널에 기록되고(앱이 재시작되어도 남음), 백그라운드 작업자가
+# 대기 중인 행을 탭별로 모아 한 번의 append_rows 호출로 구글 시트에 씁니다.
+# 실패하면 지수 백오프(+지터)로 다시 시도하고, max_attempts번 실패한 행은 'failed'로 남깁니다.
+# 같은 서버의 여러 프로세스가 한 저널을 함께 쓰므로, 보낼 행은 먼저 claim_timeout 동안 선점(next_attempt_at을 미룸)한 뒤 보냅니다.
+# 선점한 작업자가 보내는 도중 죽으면 claim_timeout이 지나 다른 작업자가 다시 보냅니다.
+import json
+import random
+import threading
+import time
+
+from sqlite_db import connect, init_db
+
+STATUS_PENDING = 'pending'
+STATUS_FAILED = 'failed'
+
+
+class SheetWriteQueue:
+    def __init__(self, journal_path, gateway, batch_size=50, max_attempts=6,
+                 base_delay=2.0, max_delay=300.0, claim_timeout=120.0):
+        self.journal_path = journal_path
+        self.gateway = gateway # worksheet(title)을 제공하는 객체 (SheetsGateway / FakeSpreadsheet)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.claim_timeout = claim_timeout # 시트 요청 시간 제한(읽기 30초)보다 넉넉하게
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        init_db(journal_path, [
+            "CREATE TABLE IF NOT EXISTS pending_rows ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " sheet_name TEXT NOT NULL,"
+            " row_json TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " created_at REAL NOT NULL,"
+            " next_attempt_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idx_pending_rows_status ON pending_rows (status, next_attempt_at)",
+        ], wal=True)
+
+    def _connect(self):
+        return connect(self.journal_path)
+
+    def start(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="sheet-write-queue", daemon=True)
+            self._worker.start()
+        return self
+
+    def enqueue(self, sheet_name, row):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO pending_rows (sheet_name, row_json, status, created_at, next_attempt_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (sheet_name, json.dumps(row, ensure_ascii=False), STATUS_PENDING, now, now),
+            )
+        self._wakeup.set()
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM pending_rows GROUP BY status").fetchall()
+        counts = {STATUS_PENDING: 0, STATUS_FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def failed_rows(self, limit=20):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, sheet_name, row_json, attempts, last_error FROM pending_rows"
+                " WHERE status = ? ORDER BY id LIMIT ?",
+                (STATUS_FAILED, limit),
+            ).fetchall()
+        return [
+            {"id": row_id, "sheet_name": sheet_name, "row": json.loads(row_json), "attempts": attempts, "last_error": last_error}
+            for row_id, sheet_name, row_json, attempts, last_error in rows
+        ]
+
+    def retry_failed(self):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE pending_rows SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_FAILED),
+            )
+        self._wakeup.set()
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def flush_once(self):
+        # 지금 보낼 수 있는 행을 탭별로 한 번씩 append_rows로 보냅니다. 보낸 행 수를 반환합니다.
+        # 고르기와 선점을 한 쓰기 트랜잭션(BEGIN IMMEDIATE)으로 묶어, 다른 프로세스가 같은 행을 함께 보내지 않게 합니다.
+        now = time.time()
+        with self._lock, connect(self.journal_path, immediate=True) as conn:
+            due = conn.execute(
+                "SELECT id, sheet_name, row_json, attempts FROM pending_rows"
+                " WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (STATUS_PENDING, now, self.batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE pending_rows SET next_attempt_at = ? WHERE id = ?",
+                [(now + self.claim_timeout, row_id) for row_id, _, _, _ in due],
+            )
+
+        batches = {}
+        for row_id, sheet_name, row_json, attempts in due:
+            batches.setdefault(sheet_name, []).append((row_id, json.loads(row_json), attempts))
+
+        written = 0
+        for sheet_name, batch in batches.items():
+            try:
+                # gateway.run을 거쳐야 API 오류 뒤에 캐시된 탭 핸들을 버리고 다음 재시도에서 다시 찾습니다.
+                rows = [row for _, row, _ in batch]
+                self.gateway.run(lambda gateway, title=sheet_name, rows=rows: gateway.worksheet(title).append_rows(rows))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                with self._lock, self._connect() as conn:
+                    for row_id, _, attempts in batch:
+                        attempts += 1
+                        status = STATUS_FAILED if attempts >= self.max_attempts else STATUS_PENDING
+                        conn.execute(
+                            "UPDATE pending_rows SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?"
+                            " WHERE id = ?",
+                            (status, attempts, error, time.time() + self._backoff(attempts), row_id),
+                        )
+                continue
+            with self._lock, self._connect() as conn:
+                conn.executemany("DELETE FROM pending_rows WHERE id = ?", [(row_id,) for row_id, _, _ in batch])
+            written += len(batch)
+        return written
+
+    def _next_wakeup_in(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM pending_rows WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def _run(self):
+        while True:
+            try:
+                self.flush_once()
+                timeout = self._next_wakeup_in()
+            except Exception:
+                timeout = self.base_delay
+            # 새 행이 들어오거나 다음 재시도 시각이 되면 깨어납니다.
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()